@@ -1,12 +1,375 @@
 import torch 
+import contextlib
+import copy
+import functools
+import gzip
+import numpy as np
 import os
+import random
+import sys
+import threading
+import time
+import queue
+import torch.distributed as dist
+import torch.multiprocessing as mp
 import torch.nn as nn
-from torch.utils.data import DataLoader , Dataset
+from torch.nn.parallel import DistributedDataParallel
+from torch.utils.data import DataLoader , Dataset , Sampler
 from tqdm import tqdm
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))   # metrics.py at the repo root
+from metrics import MetricsWriter
+
+
+# IDX files (the MNIST format) : magic number (two zero bytes , data type code , number of dimensions) ,
+# big endian int32 dimensions , then the data
+idx_dtypes = {0x08 : np.uint8 , 0x09 : np.int8 , 0x0B : ">i2" , 0x0C : ">i4" , 0x0D : ">f4" , 0x0E : ">f8"}
+
+def read_idx(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path , "rb") as f:
+        zero , dtype_code , ndim = np.frombuffer(f.read(4) , dtype = np.uint8)[[0 , 2 , 3]]
+        if zero != 0 or dtype_code not in idx_dtypes:
+            raise ValueError(f"{path} is not an IDX file")
+        shape = tuple(np.frombuffer(f.read(4 * ndim) , dtype = ">i4"))
+        return np.frombuffer(f.read() , dtype = idx_dtypes[dtype_code]).reshape(shape)
+
+
+# IDX dataset decoded once into an uncompressed .npy cache and then memory mapped , so later runs start
+# instantly and DataLoader workers share the same pages instead of each holding a copy.
+# transform gets a whole uint8 batch (N , 1 , H , W) when the DataLoader fetches batches , by default
+# it scales to float32 in [0 , 1] like torchvision's ToTensor
+class IDXDataset(Dataset):
+    def __init__(self , images_path , labels_path , cache_dir = None , transform = None , target_transform = None):
+        self.cache_dir = cache_dir or os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(images_path))) , "processed")
+        self.images_cache = self.cache(images_path)
+        self.labels_cache = self.cache(labels_path)
+        self.transform = transform
+        self.target_transform = target_transform
+        self._images = None
+        self._labels = None
+        self.length = len(self.labels)
+
+    # locate the MNIST IDX files under root (raw or gzipped) , e.g. root = "data/"
+    @classmethod
+    def mnist(cls , root , train = True , **kwargs):
+        prefix = "train" if train else "t10k"
+        paths = []
+        for name in (f"{prefix}-images-idx3-ubyte" , f"{prefix}-labels-idx1-ubyte"):
+            path = os.path.join(root , "MNIST" , "raw" , name)
+            paths.append(path if os.path.isfile(path) else path + ".gz")
+        return cls(*paths , **kwargs)
+
+    # decode an IDX file into the cache unless an up to date copy is already there
+    def cache(self , path):
+        name = os.path.basename(path)
+        cache_path = os.path.join(self.cache_dir , (name[:-3] if name.endswith(".gz") else name) + ".npy")
+        if not os.path.isfile(cache_path) or os.path.getmtime(cache_path) < os.path.getmtime(path):
+            os.makedirs(self.cache_dir , exist_ok = True)
+            tmp = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp , "wb") as f:
+                np.save(f , np.ascontiguousarray(read_idx(path)))
+            os.replace(tmp , cache_path)
+        return cache_path
+
+    # memory maps are opened lazily in each process , never pickled into DataLoader workers
+    @property
+    def images(self):
+        if self._images is None:
+            self._images = np.load(self.images_cache , mmap_mode = "r")
+        return self._images
+
+    @property
+    def labels(self):
+        if self._labels is None:
+            self._labels = np.load(self.labels_cache , mmap_mode = "r")
+        return self._labels
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_images"] = None
+        state["_labels"] = None
+        return state
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self , i):
+        images , labels = self.__getitems__([i])
+        return images[0] , labels[0]
+
+    # batched fetch used by the DataLoader , reads the batch with one fancy index and transforms it at once.
+    # returns the (images , labels) batch , which collate_fn passes through instead of splitting and stacking it again
+    def __getitems__(self , indices):
+        indices = np.asarray(indices)
+        images = torch.from_numpy(self.images[indices]).unsqueeze(1)   # fancy indexing copies only the rows needed
+        labels = torch.from_numpy(self.labels[indices].astype(np.int64))
+
+        images = self.transform(images) if self.transform is not None else images.float().div_(255)
+        if self.target_transform is not None:
+            labels = self.target_transform(labels)
+        return images , labels
+
+    # DataLoader collate_fn for the batches of __getitems__ , Model.set_dataset uses it automatically
+    @staticmethod
+    def collate_fn(batch):
+        return batch
+
+
+# random sampler for the training set that shuffles from its own generator and can start an epoch part way through ,
+# so a checkpoint taken in the middle of an epoch resumes with the same order and the remaining batches.
+# with num_replicas processes every one draws the same order (same seed) and takes every num_replicas-th sample from
+# rank , the order is padded with its first samples so all processes get the same number of batches
+class ResumableRandomSampler(Sampler):
+    def __init__(self , data_source , seed = None , num_replicas = 1 , rank = 0):
+        self.data_source = data_source
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.num_samples = -(-len(data_source) // num_replicas)   # samples per process
+        self.generator = torch.Generator()
+        self.generator.manual_seed(int(torch.empty(() , dtype = torch.int64).random_().item()) if seed is None else seed)
+        self.epoch_state = self.generator.get_state()   # generator state the current epoch's order was drawn from
+        self.start = 0                                   # samples of the current epoch already used
+
+    def __len__(self):
+        return self.num_samples - self.start
+
+    def __iter__(self):
+        if self.start:
+            self.generator.set_state(self.epoch_state)   # draw the interrupted epoch's order again
+        else:
+            self.epoch_state = self.generator.get_state()
+        order = torch.randperm(len(self.data_source) , generator = self.generator).tolist()
+        if self.num_replicas > 1:
+            order = (order + order[:self.num_samples * self.num_replicas - len(order)])[self.rank::self.num_replicas]
+        start , self.start = self.start , 0
+        return iter(order[start:])
+
+    def state_dict(self):
+        return {"generator" : self.generator.get_state() , "epoch_state" : self.epoch_state}
+
+    def load_state_dict(self , state , start = 0):
+        self.generator.set_state(state["generator"])
+        self.epoch_state = state["epoch_state"]
+        self.start = start
+
+
+# iterate a DataLoader on a background thread that also moves each batch to the device ,
+# so loading , collating and host to device copies overlap with the model's compute
+class Prefetcher:
+    def __init__(self , data_loader , to_device , depth = 2):
+        self.data_loader = data_loader
+        self.to_device = to_device
+        self.depth = depth
+
+    def __len__(self):
+        return len(self.data_loader)
+
+    def __iter__(self):
+        batches = queue.Queue(maxsize = self.depth)
+        stop = threading.Event()
+        done = object()
+
+        def produce():
+            # copies run on a side stream on cuda , the consumer waits for them with an event
+            stream = torch.cuda.Stream() if torch.cuda.is_available() else None
+            try:
+                for data , label in self.data_loader:
+                    if stop.is_set():
+                        return
+                    event = None
+                    if stream is not None:
+                        with torch.cuda.stream(stream):
+                            data , label = self.to_device(data , label)
+                        event = torch.cuda.Event()
+                        event.record(stream)
+                    else:
+                        data , label = self.to_device(data , label)
+                    batches.put((data , label , event))
+            except Exception as error:
+                batches.put(error)
+            finally:
+                batches.put(done)
+
+        thread = threading.Thread(target = produce , name = "prefetcher" , daemon = True)
+        thread.start()
+        try:
+            while True:
+                item = batches.get()
+                if item is done:
+                    break
+                if isinstance(item , Exception):
+                    raise item
+                data , label , event = item
+                if event is not None:
+                    event.wait()
+                    # the batch was allocated on the side stream , tell the caching allocator it is used on this one too ,
+                    # or it could hand the memory to the next copy while the model still reads it
+                    data.record_stream(torch.cuda.current_stream())
+                    label.record_stream(torch.cuda.current_stream())
+                yield data , label
+        finally:
+            # stop the producer if the consumer leaves early and unblock it
+            stop.set()
+            while thread.is_alive():
+                try:
+                    batches.get_nowait()
+                except queue.Empty:
+                    thread.join(timeout = 0.01)
+
+
+# timings of the training loop for Model.instrument: data wait (loading and copying to the device) , compute (forward
+# and backward) and optimizer time of every batch. optionally per layer forward / backward times and activation sizes
+# from hooks on the leaf modules , and a window of batches recorded by the torch profiler and exported as a chrome trace.
+# on cuda every measurement synchronizes the device , so training is slower while instrumented
+class Instrumentation:
+    def __init__(self , model , device_type , layers = False , profile_steps = None , profile_skip = 1 , trace_path = None):
+        self.sync = torch.cuda.synchronize if device_type == "cuda" else lambda: None
+        self.batches = []           # (data wait , compute , optimizer) seconds of each batch
+        self.layers = {}            # layer name -> calls , forward and backward seconds , activation bytes
+        self.handles = []
+        self.backward_layer = None  # (name , start) of the layer whose backward is running
+        self.last = time.perf_counter()
+
+        if layers:
+            for name , module in model.named_modules():
+                if next(module.children() , None) is None:
+                    name = name or type(module).__name__
+                    self.layers[name] = {"calls" : 0 , "forward" : 0.0 , "backward" : 0.0 , "activation_bytes" : 0}
+                    self.handles.append(module.register_forward_pre_hook(functools.partial(self.before_forward , name)))
+                    self.handles.append(module.register_forward_hook(functools.partial(self.after_forward , name)))
+
+        self.profiler = None
+        if profile_steps:
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if device_type == "cuda":
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            self.profiler = torch.profiler.profile(
+                activities = activities,
+                schedule = torch.profiler.schedule(wait = profile_skip , warmup = 1 , active = profile_steps , repeat = 1),
+                on_trace_ready = lambda profiler: profiler.export_chrome_trace(trace_path),
+                record_shapes = True,
+                profile_memory = True,
+            )
+            self.profile_steps_left = profile_skip + 1 + profile_steps
+            self.profiler.start()
+
+    # layer hooks , only training passes are timed
+    def before_forward(self , name , module , inputs):
+        if module.training:
+            self.sync()
+            self.forward_start = time.perf_counter()
+
+    def after_forward(self , name , module , inputs , output):
+        if not module.training:
+            return
+        self.sync()
+        stats = self.layers[name]
+        stats["calls"] += 1
+        stats["forward"] += time.perf_counter() - self.forward_start
+        outputs = [output] if torch.is_tensor(output) else [o for o in output if torch.is_tensor(o)] if isinstance(output , (tuple , list)) else []
+        stats["activation_bytes"] += sum(o.nbytes for o in outputs)
+        # the gradient of the output arrives when the layer's backward starts. tensor hooks instead of module backward
+        # hooks , which don't allow in place operations on the output (like ReLU(inplace = True))
+        for o in outputs:
+            if o.requires_grad:
+                o.register_hook(functools.partial(self.start_backward , name))
+                break
+
+    # the backward of a layer lasts until the next layer's starts (or the backward pass ends) , so it includes the
+    # functional operations between the two layers
+    def start_backward(self , name , grad):
+        self.end_backward()
+        self.backward_layer = (name , time.perf_counter())
+
+    def end_backward(self):
+        self.sync()
+        if self.backward_layer is not None:
+            name , start = self.backward_layer
+            self.layers[name]["backward"] += time.perf_counter() - start
+            self.backward_layer = None
+
+    # batch timings , called by train_model
+    def start_epoch(self):
+        self.last = time.perf_counter()
+
+    def batch_loaded(self):
+        self.sync()
+        self.loaded_at = time.perf_counter()
+
+    def backward_done(self):
+        self.end_backward()
+        self.computed_at = time.perf_counter()
+
+    def batch_done(self):
+        self.sync()
+        now = time.perf_counter()
+        self.batches.append((self.loaded_at - self.last , self.computed_at - self.loaded_at , now - self.computed_at))
+        self.last = now
+
+        if self.profiler is not None:
+            self.profiler.step()
+            self.profile_steps_left -= 1
+            if self.profile_steps_left == 0:   # the trace has been written
+                self.profiler.stop()
+                self.profiler = None
+
+    # remove the hooks and stop the profiler (a window that didn't finish is not exported)
+    def close(self):
+        for handle in self.handles:
+            handle.remove()
+        self.handles = []
+        if self.profiler is not None:
+            self.profiler.stop()
+            self.profiler = None
+
+    def report(self):
+        batches = np.array(self.batches , dtype = np.float64).reshape(-1 , 3)
+        totals = batches.sum(axis = 0)
+        report = {
+            "batches" : len(batches),
+            "data_wait_sec" : totals[0],
+            "compute_sec" : totals[1],
+            "optimizer_sec" : totals[2],
+            # the part of the training loop that takes the most time
+            "bound" : ("loader" , "compute" , "optimizer")[int(totals.argmax())] if len(batches) else None,
+            "layers" : sorted(({"layer" : name , **stats} for name , stats in self.layers.items()) , key = lambda stats: stats["forward"] + stats["backward"] , reverse = True),
+        }
+        return report
+
+
+# run fn(rank , world_size , *args) in world_size local processes joined in a gloo process group. a Model created in
+# fn trains on its own shard of the data and averages the gradients with the other processes (data parallel training).
+# fn must be picklable (defined at module level) and the cores are split between the processes
+def launch_distributed(fn , world_size , *args , port = 29500):
+    mp.spawn(distributed_worker , args = (fn , world_size , port , args) , nprocs = world_size)
+
+def distributed_worker(rank , fn , world_size , port , args):
+    os.environ.setdefault("MASTER_ADDR" , "127.0.0.1")
+    os.environ["MASTER_PORT"] = str(port)
+    torch.set_num_threads(max(1 , (os.cpu_count() or 1) // world_size))
+    dist.init_process_group("gloo" , rank = rank , world_size = world_size)
+    try:
+        fn(rank , world_size , *args)
+    finally:
+        dist.destroy_process_group()
+
 
 class Model(nn.Module):
-    def __init__(self, model , model_name , model_path , loss_fn , device , batch_size , learning_rate , start_from_checkpoint = False):
+    # fp32 : full precision , bf16 : bfloat16 autocast (no gradient scaling needed) , fp16 : float16 autocast with gradient scaling
+    precisions = ("fp32" , "bf16" , "fp16")
+    splits = ("train" , "test" , "val")
+    # eager : plain python , compile : torch.compile , script : TorchScript. both fall back to eager if compilation fails
+    compile_modes = ("eager" , "compile" , "script")
+
+    # DataLoader settings for set_dataset , "auto" picks the number of workers from the cores and pins memory on cuda.
+    # background_prefetch moves the batches to the device on a background thread (see Prefetcher)
+    loader_profiles = {
+        "default" : {},
+        "fast" : {"num_workers" : "auto" , "pin_memory" : "auto" , "persistent_workers" : True , "prefetch_factor" : 4 , "background_prefetch" : True},
+    }
+
+    def __init__(self, model , model_name , model_path , loss_fn , device , batch_size , learning_rate , start_from_checkpoint = False , metrics_path = None , precision = "fp32" , channels_last = False , compile_mode = "eager"):
         super().__init__()
         self.model = model
         self.model_name = model_name
@@ -27,121 +390,618 @@ class Model(nn.Module):
         self.training_accuracy = []
         self.validation_accuracy = []
 
+        # data parallel training when created in a process group (see launch_distributed). only rank 0 writes
+        # checkpoints , metrics and progress output
+        self.rank = dist.get_rank() if dist.is_available() and dist.is_initialized() else 0
+        self.world_size = dist.get_world_size() if dist.is_available() and dist.is_initialized() else 1
+        self.parallel_model = None
+
+        # timings of train_model , off (no hooks , timers or syncs) until instrument is called
+        self.instrumentation = None
+
+        # optional metrics file (.csv or .jsonl) written on a background thread
+        self.metrics = MetricsWriter(metrics_path , fields = ("step" , "split" , "loss" , "accuracy")) if metrics_path and self.rank == 0 else None
+        self.global_step = 0
+
+        # training progress , saved in checkpoints so fit can resume where it stopped
+        self.epoch = 0                  # completed epochs
+        self.batch_position = 0         # batches of the current epoch already trained
+        self.best_validation_loss = float("inf")
+        self.bad_epochs = 0             # epochs since the validation loss last improved
+        self.scheduler = None
+        self.scheduler_state = None     # scheduler state from a checkpoint , applied when fit gets its scheduler
+        self.sampler_state = None       # training order from a checkpoint , applied by set_dataset
+        self.resume_rng_state = None
+
+        self.set_precision(precision , channels_last)
+        self.set_compile_mode(compile_mode)
+        self.non_blocking = False
+        self.background_prefetch = False
+
         # create model directory if it does not exist
         if not os.path.isdir(self.model_path):
             os.makedirs(self.model_path)
 
+        self.setoptimizer()
+
         # load checkpoint if start_from_checkpoint is True. raise error if model already exists and start_from_checkpoint is False
         if self.start_from_checkpoint:
-            self.load_checkpoint(self.model_path)
+            self.load_checkpoint(self.save_path)
         else:
             if os.path.isfile(self.save_path):
                 raise ValueError(f"Model already exists at {self.save_path}. To continue training, set start_from_checkpoint to True.")
-            else:
+            elif self.rank == 0:
                 print(f"Training new model. Model will be saved to {self.save_path}")
 
-        self.setoptimizer()
-
 
     def setoptimizer(self):
         optimizer = torch.optim.Adam(self.model.parameters() , lr = self.learning_rate)
         self.optimizer = optimizer
 
-    # load model checkpoint from the specified path
-    def load_checkpoint(self , checkpoint_path):
+    # set the training precision and memory format of conv inputs and weights
+    def set_precision(self , precision = "fp32" , channels_last = False):
+        if precision not in self.precisions:
+            raise ValueError(f"precision must be one of {self.precisions}, got {precision!r}")
+
+        self.precision = precision
+        self.channels_last = channels_last
+        self.device_type = torch.device(self.device).type
+        self.autocast_dtype = {"bf16" : torch.bfloat16 , "fp16" : torch.float16}.get(precision)
+        self.scaler = torch.amp.GradScaler(self.device_type , enabled = precision == "fp16")
+
+        memory_format = torch.channels_last if channels_last else torch.contiguous_format
+        self.model = self.model.to(memory_format = memory_format)
+
+    # compile the model for training and inference. the compiled module shares its parameters with self.model ,
+    # so the optimizer and checkpoints are unaffected. torch.compile caches its kernels on disk , so later runs skip most
+    # of the compilation. the cache directory is per process (TORCHINDUCTOR_CACHE_DIR , which inductor fixes the first
+    # time it compiles): <model_path>/compile_cache of the first model compiled in the process , unless it is set already
+    def set_compile_mode(self , compile_mode = "eager"):
+        if compile_mode not in self.compile_modes:
+            raise ValueError(f"compile_mode must be one of {self.compile_modes}, got {compile_mode!r}")
+
+        self.compile_mode = compile_mode
+        self.compiled_model = None
+        if compile_mode == "compile":
+            os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR" , os.path.abspath(os.path.join(self.model_path , "compile_cache")))
+            # compilation happens on the first call , see forward for the fallback
+            self.compiled_model = torch.compile(self.model)
+        elif compile_mode == "script":
+            try:
+                self.compiled_model = torch.jit.script(self.model)
+            except Exception as error:
+                self.fall_back_to_eager(error)
+        self.wrap_parallel()
+
+    def fall_back_to_eager(self , error):
+        print(f"Compiling the model in {self.compile_mode} mode failed , falling back to eager mode: {error}")
+        self.compile_mode = "eager"
+        self.compiled_model = None
+        self.wrap_parallel()
+
+    # wrap the (compiled) model in DistributedDataParallel , which averages the gradients of the processes in backward
+    def wrap_parallel(self):
+        self.parallel_model = None
+        if self.world_size > 1:
+            model = self.compiled_model if self.compiled_model is not None else self.model
+            self.parallel_model = DistributedDataParallel(model , device_ids = [self.device] if self.device_type == "cuda" else None)
+
+    # skip the gradient averaging of DistributedDataParallel , for batches that accumulate without an optimizer step
+    def no_sync(self , skip = True):
+        if skip and self.parallel_model is not None:
+            return self.parallel_model.no_sync()
+        return contextlib.nullcontext()
+
+    # sum (or mean) of a tensor over the processes , the tensor itself in a single process
+    def all_reduce(self , tensor , mean = False):
+        if self.world_size > 1:
+            tensor = tensor.clone()
+            dist.all_reduce(tensor)
+            if mean:
+                tensor /= self.world_size
+        return tensor
+
+    # every world_size-th sample from rank , so each process evaluates its own part of a split once (no padding).
+    # None in a single process , for the whole split in order
+    def shard(self , dataset):
+        return range(self.rank , len(dataset) , self.world_size) if self.world_size > 1 else None
+
+    # autocast context for the forward pass , does nothing in fp32
+    def autocast(self):
+        return torch.autocast(self.device_type , dtype = self.autocast_dtype , enabled = self.autocast_dtype is not None)
+
+    # move a batch to the device , in channels last format for image batches if enabled
+    def to_device(self , data , label):
+        data = data.to(self.device , non_blocking = self.non_blocking)
+        if self.channels_last and data.dim() == 4:
+            data = data.contiguous(memory_format = torch.channels_last)
+        return data , label.to(self.device , non_blocking = self.non_blocking)
+
+    # random number generator states of torch , cuda , numpy and python
+    def rng_state(self):
+        return {
+            "torch" : torch.get_rng_state(),
+            "cuda" : torch.cuda.get_rng_state_all() if torch.cuda.is_available() else [],
+            "numpy" : np.random.get_state(),
+            "python" : random.getstate(),
+        }
+
+    def set_rng_state(self , state):
+        torch.set_rng_state(state["torch"])
+        if state["cuda"] and torch.cuda.is_available():
+            torch.cuda.set_rng_state_all(state["cuda"])
+        np.random.set_state(state["numpy"])
+        random.setstate(state["python"])
+
+    # load model checkpoint from the specified path (the model's save path by default)
+    def load_checkpoint(self , checkpoint_path = None):
+        checkpoint_path = checkpoint_path or self.save_path
         if os.path.isfile(checkpoint_path):
-            check_point = torch.load(checkpoint_path)
+            check_point = torch.load(checkpoint_path , map_location = self.device , weights_only = False)
 
             self.model.load_state_dict(check_point['model_state_dict'])
             self.optimizer.load_state_dict(check_point['optimizer_state_dict'])
             self.training_loss = check_point['training_loss']
             self.validation_loss = check_point['validation_loss']
 
+            # training progress , missing from checkpoints written before fit existed
+            self.training_accuracy = check_point.get('training_accuracy' , [])
+            self.validation_accuracy = check_point.get('validation_accuracy' , [])
+            self.epoch = check_point.get('epoch' , 0)
+            self.batch_position = check_point.get('batch_position' , 0)
+            self.global_step = check_point.get('global_step' , len(self.training_loss))
+            self.best_validation_loss = check_point.get('best_validation_loss' , float("inf"))
+            self.bad_epochs = check_point.get('bad_epochs' , 0)
+            self.scheduler_state = check_point.get('scheduler_state_dict')
+            self.sampler_state = check_point.get('sampler_state')
+            if check_point.get('scaler_state_dict'):
+                self.scaler.load_state_dict(check_point['scaler_state_dict'])
+            self.resume_rng_state = check_point.get('rng_state')   # restored when fit starts
+
         else:
             raise ValueError(f"No checkpoint found at {checkpoint_path}")
 
-    # save model checkpoint to the specified path
-    def save_checkpoint(self , checkpoint_file):
-        if not os.path.isdir(checkpoint_file):
-            os.makedirs(checkpoint_file)
+    # save model checkpoint to the specified path (the model's save path by default).
+    # written to a temporary file first and then renamed , so an interrupted save never leaves a broken checkpoint.
+    # all processes hold the same weights and training order , only rank 0 writes
+    def save_checkpoint(self , checkpoint_file = None):
+        if self.rank != 0:
+            return
+        checkpoint_file = checkpoint_file or self.save_path
+        checkpoint_dir = os.path.dirname(checkpoint_file)
+        if checkpoint_dir and not os.path.isdir(checkpoint_dir):
+            os.makedirs(checkpoint_dir)
 
+        sampler = getattr(self , "train_dataloader" , None) and self.train_dataloader.sampler
+        tmp = checkpoint_file + ".tmp"
         torch.save({
             'model_state_dict': self.model.state_dict(),
             'optimizer_state_dict': self.optimizer.state_dict(),
             'training_loss': self.training_loss,
-            'validation_loss': self.validation_loss
-        }, checkpoint_file)
+            'validation_loss': self.validation_loss,
+            'training_accuracy': self.training_accuracy,
+            'validation_accuracy': self.validation_accuracy,
+            'scheduler_state_dict': self.scheduler.state_dict() if self.scheduler is not None else self.scheduler_state,
+            'scaler_state_dict': self.scaler.state_dict(),
+            'epoch': self.epoch,
+            'batch_position': self.batch_position,
+            'global_step': self.global_step,
+            'best_validation_loss': self.best_validation_loss,
+            'bad_epochs': self.bad_epochs,
+            'sampler_state': sampler.state_dict() if isinstance(sampler , ResumableRandomSampler) else None,
+            'rng_state': self.rng_state(),
+        }, tmp)
+        os.replace(tmp , checkpoint_file)
 
         print(f"Model saved to {checkpoint_file}")
 
     # set dataset for training , validation and testing
-    def set_dataset(self , train_set , val_set , test_set):
+    # loader_profile is the name of one of the loader_profiles or a dict of DataLoader settings
+    # with several processes each loader only yields the process's shard of its split
+    def set_dataset(self , train_set , val_set , test_set , loader_profile = "default"):
         
-        print("Number of training samples: " , len(train_set))
-        print("Number of validation samples: " , len(val_set))
-        print("Number of test samples: " , len(test_set))
+        if self.rank == 0:
+            print("Number of training samples: " , len(train_set))
+            print("Number of validation samples: " , len(val_set))
+            print("Number of test samples: " , len(test_set))
+
+        options = self.loader_options(loader_profile)
+        self.loader_kwargs = options
+        # seeded without touching the global generator when resuming , its state comes from the checkpoint.
+        # with several processes they all shuffle with the seed of rank 0
+        seed = None
+        if self.sampler_state is not None:
+            seed = 0
+        elif self.world_size > 1:
+            seed = torch.empty(() , dtype = torch.int64).random_()
+            dist.broadcast(seed , 0)
+            seed = int(seed)
+        sampler = ResumableRandomSampler(train_set , seed = seed , num_replicas = self.world_size , rank = self.rank)
+        if self.sampler_state is not None:
+            # continue the training order of the checkpoint , skipping the batches already trained this epoch
+            sampler.load_state_dict(self.sampler_state , start = self.batch_position * self.batch_size)
+            self.sampler_state = None
+        # the loader draws its worker seeds from the sampler's generator , so starting an epoch leaves the global one alone
+        self.train_dataloader = DataLoader(train_set , batch_size = self.batch_size , sampler = sampler , generator = sampler.generator , collate_fn = self.collate_fn(train_set) , **options)
+        # the evaluation loaders get generators of their own too: without one , starting their iterator draws the workers'
+        # base seed from the global generator , and persistent workers only do that the first time , so a resumed run
+        # would draw once more than an uninterrupted one and get different dropout masks from then on
+        self.val_dataloader = DataLoader(val_set , batch_size = self.batch_size , sampler = self.shard(val_set) , generator = torch.Generator() ,
+                                         collate_fn = self.collate_fn(val_set) , **options)
+        self.test_dataloader = DataLoader(test_set , batch_size = self.batch_size , sampler = self.shard(test_set) , generator = torch.Generator() ,
+                                          collate_fn = self.collate_fn(test_set) , **options)
+
+    # collate_fn of a dataset that fetches whole batches (like IDXDataset) , also through Subset wrappers.
+    # None (the default collate) for datasets of single samples
+    @staticmethod
+    def collate_fn(dataset):
+        while not hasattr(dataset , "collate_fn") and hasattr(dataset , "dataset"):
+            dataset = dataset.dataset
+        return getattr(dataset , "collate_fn" , None)
+
+    # resolve a loader profile into DataLoader keyword arguments
+    def loader_options(self , loader_profile):
+        if isinstance(loader_profile , str):
+            if loader_profile not in self.loader_profiles:
+                raise ValueError(f"loader_profile must be one of {tuple(self.loader_profiles)} or a dict, got {loader_profile!r}")
+            loader_profile = self.loader_profiles[loader_profile]
+        options = dict(loader_profile)
+
+        self.background_prefetch = options.pop("background_prefetch" , False)
+        if options.get("num_workers") == "auto":
+            options["num_workers"] = min(8 , max(1 , (os.cpu_count() or 1) - 1))
+        if options.get("pin_memory") == "auto":
+            options["pin_memory"] = self.device_type == "cuda"
+
+        # worker settings are only valid with worker processes
+        if not options.get("num_workers"):
+            options.pop("persistent_workers" , None)
+            options.pop("prefetch_factor" , None)
 
-        self.train_dataloader = DataLoader(train_set , batch_size = self.batch_size , shuffle = True)
-        self.val_dataloader = DataLoader(val_set , batch_size = self.batch_size , shuffle = False)
-        self.test_dataloader = DataLoader(test_set , batch_size = self.batch_size , shuffle = False)
+        # pinned batches can be copied asynchronously
+        self.non_blocking = options.get("pin_memory" , False)
+        return options
 
+    # iterate a data loader , on a background prefetch thread if enabled
+    def batches(self , data_loader):
+        if self.background_prefetch:
+            return Prefetcher(data_loader , self.to_device)
+        return data_loader
 
-    # train model for one epoch
-    def train_model(self):
+
+    # time the data wait , compute and optimizer step of every batch in train_model until stop_instrumenting is called.
+    # layers = True also times the forward and backward pass of every leaf module and sums the sizes of their outputs
+    # (eager mode only , compiled models don't call the hooks). profile_steps records that many batches with the
+    # torch profiler after skipping profile_skip batches , and writes a chrome trace (chrome://tracing or
+    # ui.perfetto.dev) to trace_path , <model_path>/<model_name>_trace.json by default
+    def instrument(self , layers = False , profile_steps = None , profile_skip = 1 , trace_path = None):
+        self.stop_instrumenting(print_report = False)
+        if layers and self.compile_mode != "eager":
+            print(f"Layer hooks don't run inside a model compiled in {self.compile_mode} mode , set_compile_mode('eager') to time the layers")
+        trace_path = trace_path or os.path.join(self.model_path , self.model_name + "_trace.json")
+        self.instrumentation = Instrumentation(self.model , self.device_type , layers , profile_steps , profile_skip , trace_path)
+
+    # remove the instrumentation and return (and print) its report
+    def stop_instrumenting(self , print_report = True):
+        if self.instrumentation is None:
+            return None
+        report = self.instrumentation.report()
+        self.instrumentation.close()
+        self.instrumentation = None
+
+        if print_report and report["batches"]:
+            total = report["data_wait_sec"] + report["compute_sec"] + report["optimizer_sec"]
+            print(f"{report['batches']} batches , {report['bound']} bound")
+            for part in ("data_wait" , "compute" , "optimizer"):
+                seconds = report[part + "_sec"]
+                print(f"{part:<10} {seconds:>8.3f} sec  {seconds / report['batches'] * 1000:>8.2f} ms/batch  {seconds / total:>6.1%}")
+            for stats in report["layers"]:
+                calls = max(stats["calls"] , 1)
+                print(f"{stats['layer']:<20} forward {stats['forward'] / calls * 1000:>7.3f} ms  backward {stats['backward'] / calls * 1000:>7.3f} ms  "
+                      f"activations {stats['activation_bytes'] / calls / 2 ** 20:>8.2f} MiB")
+        return report
+
+    # train model for one epoch (the rest of it when resuming from a checkpoint).
+    # accumulation_steps batches are accumulated into each optimizer step , and with checkpoint_every a checkpoint is
+    # written every that many batches (on an optimizer step boundary)
+    def train_model(self , max_batches = None , accumulation_steps = 1 , checkpoint_every = None):
         # set model to training mode
         self.model.train()
+        losses = []
+        num_batches = self.batch_position + len(self.train_dataloader)
+        timer = self.instrumentation
 
-        for i , (data , label) in enumerate(tqdm(self.train_dataloader , desc = "Training" , leave=False)):
+        self.optimizer.zero_grad()
+        if timer is not None:
+            timer.start_epoch()
+        for i , (data , label) in enumerate(tqdm(self.batches(self.train_dataloader) , desc = "Training" , leave=False , disable = self.rank != 0)):
+            if max_batches is not None and i >= max_batches:
+                break
 
-            # move data to device
-            data = data.to(self.device)
-            label = label.to(self.device)
+            # move data to device (already done by the prefetcher if enabled)
+            data , label = self.to_device(data , label)
+            if timer is not None:
+                timer.batch_loaded()
+
+            # optimization every accumulation_steps batches and at the end of the epoch ,
+            # the gradients are only averaged across processes for those batches
+            step = (self.batch_position + 1) % accumulation_steps == 0 or self.batch_position + 1 == num_batches
             
-            # forward pass , backward pass and optimization
-            self.optimizer.zero_grad()
-            output = self.forward(data)
-            loss = self.loss_fn(output , label)
-            loss.backward()
-            self.optimizer.step()
+            # forward pass in the selected precision and backward pass (the scaler is a no-op unless fp16)
+            with self.no_sync(not step):
+                with self.autocast():
+                    output = self.forward(data)
+                    loss = self.loss_fn(output , label)
+                self.scaler.scale(loss / accumulation_steps).backward()
+            self.batch_position += 1
+            if timer is not None:
+                timer.backward_done()
+
+            # keep the loss on the device, loss.item() would wait for the device on every batch
+            losses.append(loss.detach())
+            if self.metrics is not None:
+                self.metrics.log(step = self.global_step , split = "train" , loss = loss)
+            self.global_step += 1
+
+            if step:
+                self.scaler.step(self.optimizer)
+                self.scaler.update()
+                self.optimizer.zero_grad()
+
+                if checkpoint_every and self.batch_position % checkpoint_every == 0 and self.batch_position < num_batches:
+                    self.training_loss.extend(self.all_reduce(torch.stack(losses) , mean = True).tolist())
+                    losses = []
+                    self.save_checkpoint()
+
+            if timer is not None:
+                timer.batch_done()
+
+        # one sync for the whole epoch , the losses are averaged over the processes
+        if losses:
+            self.training_loss.extend(self.all_reduce(torch.stack(losses) , mean = True).tolist())
+        # a finished epoch (or a partial one for benchmarks) starts over next time
+        if self.batch_position >= num_batches or max_batches is not None:
+            self.batch_position = 0
+
+    # train for up to epochs epochs in total (counting the epochs of a resumed checkpoint) , validating after each.
+    # stops early when the validation loss hasn't improved by min_delta for patience epochs , keeping the best weights
+    # in <model_name>_best.pth. a checkpoint is written after every epoch and every checkpoint_every batches , and
+    # start_from_checkpoint = True continues exactly from the last one. scheduler is an lr scheduler of self.optimizer ,
+    # stepped once per epoch (with the validation loss for ReduceLROnPlateau)
+    def fit(self , epochs , accumulation_steps = 1 , patience = None , min_delta = 0.0 , scheduler = None , checkpoint_every = None , restore_best = True):
+        self.scheduler = scheduler
+        if scheduler is not None and self.scheduler_state is not None:
+            scheduler.load_state_dict(self.scheduler_state)
+            self.scheduler_state = None
+        best_path = os.path.join(self.model_path , self.model_name + "_best.pth")
+        if self.resume_rng_state is not None:
+            self.set_rng_state(self.resume_rng_state)
+            self.resume_rng_state = None
+
+        while self.epoch < epochs:
+            self.train_model(accumulation_steps = accumulation_steps , checkpoint_every = checkpoint_every)
+            validation_loss = self.evaluate_model("val")["loss"]
+            self.epoch += 1
+
+            if scheduler is not None:
+                if isinstance(scheduler , torch.optim.lr_scheduler.ReduceLROnPlateau):
+                    scheduler.step(validation_loss)
+                else:
+                    scheduler.step()
 
-            self.training_loss.append(loss.item())
+            # early stopping on the validation loss
+            if validation_loss < self.best_validation_loss - min_delta:
+                self.best_validation_loss = validation_loss
+                self.bad_epochs = 0
+                if self.rank == 0:
+                    torch.save(self.model.state_dict() , best_path + ".tmp")
+                    os.replace(best_path + ".tmp" , best_path)
+            else:
+                self.bad_epochs += 1
+
+            if self.rank == 0:
+                print(f"Epoch {self.epoch}/{epochs} training loss {np.mean(self.training_loss[-len(self.train_dataloader):]):.4f} validation loss {validation_loss:.4f}")
+            self.save_checkpoint()
+
+            # the validation loss is reduced over the processes , so they all stop together
+            if patience is not None and self.bad_epochs >= patience:
+                if self.rank == 0:
+                    print(f"Early stopping , no improvement for {patience} epochs")
+                break
+
+        if self.world_size > 1:
+            dist.barrier()   # rank 0 has written the best weights
+        if restore_best and os.path.isfile(best_path):
+            self.model.load_state_dict(torch.load(best_path , map_location = self.device))
 
-    # evaluate model on validation set on one epoch
-    def evaluate_model(self , train_test_val="val"):
+    # evaluate model on the train , test or val split for one epoch.
+    # loss , top k accuracies and the confusion matrix are accumulated on the device and read back with a single sync
+    # at the end. batch_size overrides the training batch size (no gradients are kept , so larger batches fit) and
+    # record = False leaves the loss and accuracy lists untouched. with several processes each evaluates its shard and
+    # the sums are reduced over them. accuracy is always the top 1 accuracy , top_k values above the number of classes
+    # are left out
+    def evaluate_model(self , train_test_val = "val" , top_k = (1 , 5) , batch_size = None , inference_mode = True , record = True):
+        if train_test_val not in self.splits:
+            raise ValueError(f"train_test_val must be one of {self.splits}, got {train_test_val!r}")
         self.model.eval()
-        acc = 0
-
-        data_loader = None
-        if train_test_val == "train":
-            data_loader = self.train_dataloader
-        elif train_test_val == "test":
-            data_loader = self.test_dataloader
-        elif train_test_val == "val":
-            data_loader = self.val_dataloader
-        else:
-            ValueError("train_test_val must be one of 'train', 'test' or 'val'")
 
-        with torch.no_grad():
-            for data , label in tqdm(data_loader , desc = "Evaluating" , leave=False):
-                data = data.to(self.device)
-                label = label.to(self.device)
+        data_loader = {"train" : self.train_dataloader , "test" : self.test_dataloader , "val" : self.val_dataloader}[train_test_val]
+        # the train split gets its own loader in order: iterating the training sampler would draw a new order from its
+        # generator and drop the position of an interrupted epoch (and it is padded with several processes)
+        if (batch_size is not None and batch_size != data_loader.batch_size) or train_test_val == "train":
+            data_loader = DataLoader(data_loader.dataset , batch_size = batch_size or self.batch_size , sampler = self.shard(data_loader.dataset) ,
+                                     generator = torch.Generator() , collate_fn = data_loader.collate_fn , **self.loader_kwargs)
+
+        total_loss = torch.zeros(() , dtype = torch.float64 , device = self.device)
+        samples = 0
+        correct = None
+        confusion = None
+
+        with torch.inference_mode() if inference_mode else torch.no_grad():
+            for data , label in tqdm(self.batches(data_loader) , desc = "Evaluating" , leave=False , disable = self.rank != 0):
+                data , label = self.to_device(data , label)
+
+                with self.autocast():
+                    output = self.forward(data)
+                    loss = self.loss_fn(output , label)
 
-                output = self.forward(data)
-                loss = self.loss_fn(output , label)
+                # loss_fn averages over the batch , weight it by the batch size for the mean over the split
+                total_loss += loss.detach().double() * len(data)
+                samples += len(data)
 
-                acc += (output == label).sum().item()
+                # classification metrics when the model outputs logits for integer labels
+                if output.dim() == 2 and label.dim() == 1 and not label.is_floating_point():
+                    num_classes = output.shape[1]
+                    ks = [k for k in top_k if k <= num_classes]   # top k of more than all classes is always right
+                    if correct is None:
+                        correct = torch.zeros(len(ks) , dtype = torch.long , device = self.device)
+                        confusion = torch.zeros(num_classes * num_classes , dtype = torch.long , device = self.device)
 
-            # calculate accuracy and append to list of accuracies
+                    top = output.topk(max(ks , default = 1) , dim = 1).indices
+                    hits = (top == label[: , None]).cumsum(dim = 1)
+                    correct += hits[: , [k - 1 for k in ks]].sum(dim = 0)
+                    confusion += torch.bincount(label * num_classes + top[: , 0] , minlength = num_classes * num_classes)
+
+        # sums over the shards of all processes
+        if self.world_size > 1:
+            total_loss = self.all_reduce(total_loss)
+            samples = int(self.all_reduce(torch.tensor(samples , device = self.device)))
+            if correct is not None:
+                correct = self.all_reduce(correct)
+                confusion = self.all_reduce(confusion)
+
+        # the only sync with the device
+        results = {"loss" : total_loss.item() / max(samples , 1)}
+        if correct is not None:
+            for k , hits in zip(ks , correct.tolist()):
+                results[f"top{k}_accuracy"] = hits / samples
+            results["confusion_matrix"] = confusion.view(num_classes , num_classes).cpu()   # rows : labels , columns : predictions
+            results["accuracy"] = results["confusion_matrix"].diag().sum().item() / samples   # top 1 , whatever top_k is
+
+        if record:
+            # the train split has no loss list of its own , its loss comes from train_model
             if train_test_val == "train":
-                self.validation_loss.append(loss.item())
-                self.training_accuracy.append(acc / len(self.train_dataloader.dataset))
-            elif train_test_val == "test":
-                self.validation_loss.append(loss.item())
-                self.validation_accuracy.append(acc / len(self.test_dataloader.dataset))
-            elif train_test_val == "val":
-                self.validation_loss.append(loss.item())
-                self.validation_accuracy.append(acc / len(self.val_dataloader.dataset))
-            
+                self.training_accuracy.append(results.get("accuracy"))
+            else:
+                self.validation_loss.append(results["loss"])
+                self.validation_accuracy.append(results.get("accuracy"))
+            if self.metrics is not None:
+                self.metrics.log(step = self.global_step , split = train_test_val , loss = results["loss"] , accuracy = results.get("accuracy"))
+
+        return results
+
+    # train the same initial weights on the same batches for num_batches in each precision , report throughput and
+    # validation accuracy. the training state (weights , optimizer , scaler , training order , random number generators
+    # and epoch position) is restored afterwards , so the comparison doesn't change the following training
+    def compare_precision(self , precisions = ("fp32" , "bf16") , channels_last = (False , True) , num_batches = 50):
+        initial_model = copy.deepcopy(self.model.state_dict())
+        initial_optimizer = copy.deepcopy(self.optimizer.state_dict())
+        initial_mode = (self.precision , self.channels_last)
+        initial_scaler = self.scaler
+        initial_loss = (len(self.training_loss) , self.global_step)
+        initial_position = self.batch_position
+        initial_rng = self.rng_state()
+        sampler = self.train_dataloader.sampler
+        initial_sampler = (copy.deepcopy(sampler.state_dict()) , sampler.start) if isinstance(sampler , ResumableRandomSampler) else None
+        metrics , self.metrics = self.metrics , None   # keep the comparison runs out of the metrics file
+
+        # every mode starts from the same state
+        def reset():
+            self.model.load_state_dict(initial_model)
+            self.optimizer.load_state_dict(copy.deepcopy(initial_optimizer))   # the optimizer keeps (and updates) the state tensors it is given
+            self.batch_position = initial_position
+            self.set_rng_state(initial_rng)
+            if initial_sampler is not None:
+                sampler.load_state_dict(*initial_sampler)
+
+        results = []
+        for precision in precisions:
+            for memory_format in channels_last:
+                reset()
+                self.set_precision(precision , memory_format)
+
+                start = time.perf_counter()
+                self.train_model(max_batches = num_batches)
+                elapsed = time.perf_counter() - start
+                samples = min(num_batches * self.batch_size , len(self.train_dataloader.dataset))
+
+                evaluation = self.evaluate_model("val" , top_k = (1 ,) , record = False)
+
+                results.append({
+                    "precision" : precision,
+                    "channels_last" : memory_format,
+                    "samples_per_sec" : samples / elapsed,
+                    "final_loss" : self.training_loss[-1],
+                    "val_accuracy" : evaluation.get("accuracy"),
+                })
+
+        # restore the model as it was
+        reset()
+        self.set_precision(*initial_mode)
+        self.scaler = initial_scaler
+        del self.training_loss[initial_loss[0]:]
+        self.global_step = initial_loss[1]
+        self.metrics = metrics
+
+        for result in results:
+            accuracy = "" if result["val_accuracy"] is None else f"  val accuracy {result['val_accuracy']:.4f}"
+            print(f"{result['precision']:<5} channels_last={result['channels_last']!s:<5} "
+                  f"{result['samples_per_sec']:>10.1f} samples/sec  loss {result['final_loss']:.4f}{accuracy}")
+        return results
+
+    # time forward and backward passes of the same batch in each compile mode (the first call includes the compilation).
+    # gradients are cleared afterwards and the weights are not updated
+    def compare_compile(self , compile_modes = ("eager" , "compile") , num_batches = 20 , warmup = 3):
+        initial_mode = self.compile_mode
+        data , label = self.to_device(*next(iter(self.val_dataloader)))
+        sync = torch.cuda.synchronize if self.device_type == "cuda" else lambda: None
+
+        def step():
+            with self.autocast():
+                loss = self.loss_fn(self.forward(data) , label)
+            loss.backward()
+            sync()
+
+        results = []
+        self.model.train()
+        for compile_mode in compile_modes:
+            self.set_compile_mode(compile_mode)
+
+            start = time.perf_counter()
+            step()
+            first_step = time.perf_counter() - start
+            for _ in range(warmup):
+                step()
+
+            start = time.perf_counter()
+            for _ in range(num_batches):
+                step()
+            results.append({
+                "compile_mode" : self.compile_mode,   # eager if compilation failed
+                "first_step_sec" : first_step,
+                "step_ms" : (time.perf_counter() - start) / num_batches * 1000,
+            })
+            self.optimizer.zero_grad()
+
+        self.set_compile_mode(initial_mode)
+        eager_ms = next((result["step_ms"] for result in results if result["compile_mode"] == "eager") , None)
+        for result in results:
+            result["speedup"] = eager_ms / result["step_ms"] if eager_ms else None
+            speedup = "" if result["speedup"] is None else f"  speedup {result['speedup']:.2f}x"
+            print(f"{result['compile_mode']:<8} first step {result['first_step_sec']:>7.2f} sec  {result['step_ms']:>8.2f} ms/step{speedup}")
+        return results
 
+    # training steps go through DistributedDataParallel when there are several processes , evaluation runs each
+    # process's shard on its own
     def forward(self , x):
-        return self.model(x)
\ No newline at end of file
+        parallel = self.parallel_model is not None and self.model.training
+        if self.compiled_model is not None:
+            try:
+                return self.parallel_model(x) if parallel else self.compiled_model(x)
+            except torch._dynamo.exc.TorchDynamoException as error:
+                # torch.compile compiles on the first call (and again for new input shapes). errors raised by the
+                # model itself while tracing (bad shapes , dtypes ...) are not compilation failures
+                if self.compile_mode != "compile" or isinstance(error , torch._dynamo.exc.TorchRuntimeError):
+                    raise
+                self.fall_back_to_eager(error)
+        return self.parallel_model(x) if parallel else self.model(x)
\ No newline at end of file
@@ -0,0 +1,81 @@
+"""Check that Model.fit resumes exactly from a mid-epoch checkpoint with each DataLoader profile.
+
+For every profile one run trains uninterrupted , a second run is interrupted in the middle of an epoch and
+continued from its last checkpoint with start_from_checkpoint = True. The losses and the weights of both runs
+have to be identical:
+
+    python check_resume.py --profiles default fast
+"""
+import argparse
+import importlib
+import os
+import sys
+import tempfile
+
+import torch
+import torch.nn as nn
+from torch.utils.data import TensorDataset
+
+sys.path.insert(0 , os.path.dirname(os.path.abspath(__file__)))
+model_module = importlib.import_module("06_model")   # importable by name , so DataLoader workers can unpickle it
+
+
+class Interrupted(Exception):
+    pass
+
+
+# cross entropy that raises after a number of training batches , like a crash in the middle of an epoch
+class InterruptingLoss(nn.CrossEntropyLoss):
+    def __init__(self , after):
+        super().__init__()
+        self.after = after
+
+    def forward(self , output , label):
+        if torch.is_grad_enabled():
+            self.after -= 1
+            if self.after < 0:
+                raise Interrupted()
+        return super().forward(output , label)
+
+
+def build(model_path , loader_profile , resume = False , loss_fn = None):
+    torch.manual_seed(0)
+    generator = torch.Generator().manual_seed(123)
+    x = torch.randn(700 , 20 , generator = generator)
+    y = (x[: , 0] > 0).long()
+
+    net = nn.Sequential(nn.Linear(20 , 64) , nn.ReLU() , nn.Dropout(0.3) , nn.Linear(64 , 2))
+    model = model_module.Model(net , "resume" , model_path , loss_fn or nn.CrossEntropyLoss() , "cpu" , 32 , 1e-2 , start_from_checkpoint = resume)
+    model.set_dataset(TensorDataset(x[:500] , y[:500]) , TensorDataset(x[500:] , y[500:]) , TensorDataset(x[500:] , y[500:]) , loader_profile = loader_profile)
+    return model
+
+
+def check_resume(loader_profile , epochs = 3 , checkpoint_every = 4 , interrupt_after = 22):
+    """True if an interrupted and resumed fit ends with the same losses and weights as an uninterrupted one."""
+    with tempfile.TemporaryDirectory() as tmp:
+        uninterrupted = build(os.path.join(tmp , "uninterrupted") , loader_profile)
+        uninterrupted.fit(epochs , checkpoint_every = checkpoint_every , restore_best = False)
+
+        interrupted = build(os.path.join(tmp , "resumed") , loader_profile , loss_fn = InterruptingLoss(interrupt_after))
+        try:
+            interrupted.fit(epochs , checkpoint_every = checkpoint_every , restore_best = False)
+        except Interrupted:
+            pass
+        del interrupted   # lets its loader workers exit
+
+        resumed = build(os.path.join(tmp , "resumed") , loader_profile , resume = True)
+        resumed.fit(epochs , checkpoint_every = checkpoint_every , restore_best = False)
+
+        return (uninterrupted.training_loss == resumed.training_loss and uninterrupted.validation_loss == resumed.validation_loss
+                and all(torch.equal(a , b) for a , b in zip(uninterrupted.model.state_dict().values() , resumed.model.state_dict().values())))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Check that Model.fit resumes exactly from a mid-epoch checkpoint.")
+    parser.add_argument("--profiles" , nargs = "+" , default = list(model_module.Model.loader_profiles) , choices = list(model_module.Model.loader_profiles))
+    args = parser.parse_args()
+
+    failed = [profile for profile in args.profiles if not check_resume(profile)]
+    for profile in args.profiles:
+        print(f"{profile:<10} {'FAILED' if profile in failed else 'ok'}")
+    sys.exit(1 if failed else 0)
@@ -1,10 +1,10 @@
 import gymnasium as gym
-from airplane_boarding import AirplaneEnv
+import airplane_boarding # Registers AirplaneBoarding-v0
+from vec_airplane_boarding import AirplaneBoardingVecEnv
 from sb3_contrib import MaskablePPO
 from sb3_contrib.common.maskable.utils import get_action_masks
 
-from stable_baselines3.common.vec_env.subproc_vec_env import SubprocVecEnv
-from stable_baselines3.common.env_util import make_vec_env
+from stable_baselines3.common.vec_env import VecMonitor
 from sb3_contrib.common.maskable.callbacks import  MaskableEvalCallback
 from stable_baselines3.common.callbacks import StopTrainingOnNoModelImprovement, StopTrainingOnRewardThreshold
 
@@ -13,34 +13,40 @@ import os
 model_dir = "models"
 log_dir = "logs"
 
-def train():
+def train(num_rows=10, seats_per_row=5, ent_coef=0.05, seed=None, total_timesteps=int(1e10), n_envs=12,
+          model_dir=model_dir, log_dir=log_dir, verbose=1, callback=None):
 
-    env = make_vec_env(AirplaneEnv, n_envs=12, env_kwargs={"num_of_rows":10, "seats_per_row":5}, vec_env_cls=SubprocVecEnv)
+    # All the cabins are stepped together in one process, no need for SubprocVecEnv
+    env = VecMonitor(AirplaneBoardingVecEnv(num_envs=n_envs, num_rows=num_rows, seats_per_row=seats_per_row))
 
     # Increase ent_coef to encourage exploration, this resulted in a better solution.
-    model = MaskablePPO('MlpPolicy', env, verbose=1, device='cpu', tensorboard_log=log_dir, ent_coef=0.05)
+    model = MaskablePPO('MlpPolicy', env, verbose=verbose, device='cpu', tensorboard_log=log_dir, ent_coef=ent_coef, seed=seed)
 
     eval_callback = MaskableEvalCallback(
         env,
         eval_freq=10_000,
         # callback_on_new_best = StopTrainingOnRewardThreshold(reward_threshold=???, verbose=1)
         # callback_after_eval  = StopTrainingOnNoModelImprovement(max_no_improvement_evals=???, min_evals=???, verbose=1)
-        verbose=1,
+        verbose=verbose,
         best_model_save_path=os.path.join(model_dir, 'MaskablePPO'),
     )
 
     """
     total_timesteps: pass in a very large number to train (almost) indefinitely.
-    callback: pass in reference to a callback fuction above
+    callback: pass in reference to a callback fuction above, extra callbacks are run after it
     """
-    model.learn(total_timesteps=int(1e10), callback=eval_callback)
+    callbacks = [eval_callback] if callback is None else [eval_callback, callback]
+    model.learn(total_timesteps=total_timesteps, callback=callbacks)
+    model.save(os.path.join(model_dir, 'MaskablePPO', 'final_model'))
 
-def test(model_name, render=True):
+    return model
 
-    env = gym.make('airplane-boarding-v0', num_of_rows=10, seats_per_row=5, render_mode='human' if render else None)
+def test(model_name, render=True, num_rows=10, seats_per_row=5, model_dir=model_dir):
+
+    env = gym.make('AirplaneBoarding-v0', num_rows=num_rows, seats_per_row=seats_per_row, render_mode='human' if render else None)
 
     # Load model
-    model = MaskablePPO.load(f'models/MaskablePPO/{model_name}', env=env)
+    model = MaskablePPO.load(os.path.join(model_dir, 'MaskablePPO', model_name), env=env)
 
     rewards = 0
     # Run a test
@@ -58,7 +64,7 @@ def test(model_name, render=True):
 
     print(f"Total rewards: {rewards}")
 
+    return rewards
+
 if __name__ == '__main__':
     train()
-
-
@@ -1,3 +1,5 @@
+from collections import deque
+
 import gymnasium as gym
 import gymnasium.spaces as spaces
 from gymnasium.envs.registration import register
@@ -31,11 +33,19 @@ class PassengerStatus:
             
 class Passenger:
     """Class to represent a passenger in the airplane boarding simulation."""
+    __slots__ = ("row_no" , "seat_no" , "is_carrying_baggage" , "status" , "seat")
+
     def __init__(self , row_no : int , seat_no : str , is_carrying_baggage : bool = True):
         self.row_no = row_no
         self.seat_no = seat_no
         self.is_carrying_baggage = is_carrying_baggage
         self.status = PassengerStatus.MOVING
+        self.seat = None   # Assigned seat, set by the environment
+
+    def reset(self):
+        """Put the passenger back in the lobby state, with baggage."""
+        self.is_carrying_baggage = True
+        self.status = PassengerStatus.MOVING
     
     def __str__(self):
         return f"{self.seat_no:02d}"
@@ -43,60 +53,145 @@ class Passenger:
 
 class LobbyRow:
     """Class to represent a row in the airplane lobby."""
+    __slots__ = ("row_no" , "all_passengers" , "passengers")
+
     def __init__(self , row_no : int , seats_per_row : int):
         self.row_no = row_no
-        self.passengers = [Passenger(row_no , row_no * seats_per_row + i) for i in range(1 , seats_per_row + 1)]   # Assuming seat numbers start from 1
+        self.all_passengers = [Passenger(row_no , (row_no - 1) * seats_per_row + i) for i in range(1 , seats_per_row + 1)]   # Assuming seat numbers start from 1
+        self.passengers = deque(self.all_passengers)
+
+    def reset(self):
+        """Bring every passenger of the row back, reusing the same Passenger objects."""
+        for passenger in self.all_passengers:
+            passenger.reset()
+        self.passengers.clear()
+        self.passengers.extend(self.all_passengers)
 
 
 class Lobby:
     """Class to represent the airplane lobby."""
+    __slots__ = ("num_rows" , "seats_per_row" , "lobby_rows" , "no_of_passengers" , "available_rows")
+
     def __init__(self , num_rows : int , seats_per_row : int):
         self.num_rows = num_rows
         self.seats_per_row = seats_per_row
         self.lobby_rows = [LobbyRow(i , self.seats_per_row) for i in range(1 , self.num_rows + 1)]
+
+        # Running counters, updated on every removal so queries don't scan the rows
+        self.no_of_passengers = self.num_rows * self.seats_per_row
+        self.available_rows = np.ones(self.num_rows , dtype=bool)   # True for the rows that still have passengers
+
+    def reset(self):
+        """Bring every passenger back to the lobby without reallocating the rows."""
+        for row in self.lobby_rows:
+            row.reset()
+        self.no_of_passengers = self.num_rows * self.seats_per_row
+        self.available_rows.fill(True)
         
     def remove_passenger(self , row_num: int):
         """Remove a passenger from the lobby row."""
-        if self.lobby_rows[row_num - 1].passengers:
-            return self.lobby_rows[row_num - 1].passengers.pop(0)
+        passengers = self.lobby_rows[row_num - 1].passengers
+        if passengers:
+            self.no_of_passengers -= 1
+            if len(passengers) == 1:
+                self.available_rows[row_num - 1] = False
+            return passengers.popleft()
         return None
     
     def count_passengers(self):
         """Count the total number of passengers in the lobby."""
-        return sum(len(row.passengers) for row in self.lobby_rows)
+        return self.no_of_passengers
     
 
 class BoardingArea:
-    """Class to represent the boarding area of the airplane."""
-    def __init__(self , num_rows : int):
+    """Class to represent the boarding area of the airplane.
+
+    If an `observation` array is given, `update_observation` keeps it up to date in place with
+    the seat number and status of the passenger at each spot of the line (-1 for empty spots).
+    Only the spots that changed since the last update are written.
+    """
+    __slots__ = ("num_rows" , "line" , "observation" , "_changed_spots" , "no_of_passengers" , "status_counts")
+
+    def __init__(self , num_rows : int , observation : np.ndarray = None):
         self.num_rows = num_rows   # Number of rows in the boarding area
         self.line = [None for _ in range(num_rows)]  # None indicates empty space
+
+        self.observation = observation
+        self._changed_spots = []
+        self.reset()
+
+    def reset(self):
+        """Empty the line and its observation."""
+        del self.line[self.num_rows:]
+        for i in range(self.num_rows):
+            self.line[i] = None
+        self._changed_spots.clear()
+        if self.observation is not None:
+            self.observation.fill(-1)
+
+        # Running counters of the passengers in the line, kept up to date on every change
+        self.no_of_passengers = 0
+        self.status_counts = [0 , 0 , 0 , 0]   # Indexed by PassengerStatus
         
     def add_passenger(self , passenger : Passenger):
         """Add a passenger to the boarding area."""
         self.line.append(passenger)
+        if passenger is not None:
+            self.no_of_passengers += 1
+            self.status_counts[passenger.status] += 1
+            self._observe(len(self.line) - 1)
+
+    def remove_passenger(self , i : int):
+        """Remove the passenger at spot i of the line."""
+        self.no_of_passengers -= 1
+        self.status_counts[self.line[i].status] -= 1
+        self.line[i] = None
+        self._observe(i)
+
+    def set_status(self , i : int , status : int):
+        """Change the status of the passenger at spot i of the line."""
+        old_status = self.line[i].status
+        self.line[i].status = status
+        self.status_changed(i , old_status)
+
+    def status_changed(self , i : int , old_status : int):
+        """Record that the passenger at spot i of the line changed from old_status to its current status."""
+        self.status_counts[old_status] -= 1
+        self.status_counts[self.line[i].status] += 1
+        self._observe(i)
+
+    def _observe(self , i : int):
+        """Mark spot i of the line as changed since the last observation update."""
+        if self.observation is not None:
+            self._changed_spots.append(i)
+
+    def update_observation(self):
+        """Write the spots of the line that changed to the observation array."""
+        for i in set(self._changed_spots):
+            if 2 * i >= self.observation.size:
+                continue
+            passenger = self.line[i] if i < len(self.line) else None
+            if passenger is None:
+                self.observation[2 * i] = -1
+                self.observation[2 * i + 1] = -1
+            else:
+                self.observation[2 * i] = passenger.seat_no
+                self.observation[2 * i + 1] = passenger.status
+        self._changed_spots.clear()
 
     def is_onboarding(self):
         """Check if Passengers are still onboarding."""
-        if len(self.line) > 0 and all(passenger is None for passenger in self.line):
+        if len(self.line) > 0 and self.no_of_passengers == 0:
             return False
         return True
     
     def no_of_waiting_passengers(self):
         """Count the number of waiting passengers in the boarding area."""
-        count = 0
-        for passenger in self.line:
-            if passenger is not None and passenger.status == PassengerStatus.WAITING:
-                count += 1
-        return count
+        return self.status_counts[PassengerStatus.WAITING]
     
     def no_of_moving_passengers(self):
         """Count the number of moving passengers in the boarding area."""
-        count = 0
-        for passenger in self.line:
-            if passenger is not None and passenger.status == PassengerStatus.MOVING:
-                count += 1
-        return count
+        return self.status_counts[PassengerStatus.MOVING]
     
     def move_forward(self):
         """Move passengers forward in the boarding area."""
@@ -110,25 +205,40 @@ class BoardingArea:
 
             # Move passenger forward, if no one is blocking the way 
             if (passenger.status == PassengerStatus.WAITING or passenger.status == PassengerStatus.MOVING) and self.line[i-1] is None:
-                passenger.status = PassengerStatus.MOVING
+                self.set_status(i , PassengerStatus.MOVING)
                 self.line[i-1] = passenger
                 self.line[i] = None
+                self._observe(i-1)
+                self._observe(i)
             else:
-                passenger.status = PassengerStatus.WAITING
+                self.set_status(i , PassengerStatus.WAITING)
 
         # Truncate the empty spots at the end of the line
+        line_len = len(self.line)
+        first_removed = line_len
         for i in range(len(self.line)-1, self.num_rows-1, -1):
             if self.line[i] is None:
                 self.line.pop(i)
+                first_removed = i
+
+        # Passengers behind a removed spot moved up in the line
+        for i in range(first_removed , line_len):
+            self._observe(i)
 
         
 class Seat:
     """Class to represent a seat in the airplane."""
+    __slots__ = ("row_no" , "seat_no" , "passenger")
+
     def __init__(self , row_no : int , seat_no : str):
         self.row_no = row_no
         self.seat_no = seat_no
         self.passenger = None  # No passenger initially
 
+    def reset(self):
+        """Free the seat."""
+        self.passenger = None
+
     def seat_passenger(self , passenger : Passenger):
         """Seat a passenger in the seat."""
         
@@ -149,35 +259,305 @@ class Seat:
         return f"{self.seat_no}"
 
 class AirplaneRow:
+    __slots__ = ("row_num" , "seats" , "seat_index")
+
     def __init__(self, row_num, seats_per_row):
         self.row_num = row_num
-        self.seats = [Seat(row_num * seats_per_row + i, row_num) for i in range(seats_per_row)]
+        self.seats = [Seat(row_num , (row_num - 1) * seats_per_row + i) for i in range(1 , seats_per_row + 1)]
+        self.seat_index = {seat.seat_no: seat for seat in self.seats}   # Seat number -> Seat
+
+    def reset(self):
+        """Free every seat of the row."""
+        for seat in self.seats:
+            seat.reset()
 
     def try_sit_passenger(self, passenger: Passenger):
         # Check if passenger's seat is in this row
-        found_seats = list(filter(lambda seats: seats.seat_num == passenger.seat_num, self.seats))
+        found_seat = self.seat_index.get(passenger.seat_no)
 
-        if found_seats:
-            found_seat: Seat = found_seats[0]
+        if found_seat is not None:
             return found_seat.seat_passenger(passenger)
 
         return False
     
         
+def drain_timeline(positions , targets , is_carrying_baggage , is_standing):
+    """Compute the rest of the boarding analytically once no passenger is left in the lobby.
+
+    Passengers can't overtake each other, so passenger k (ordered front to back) at spot
+    p_k(t) after tick t follows
+
+        p_k(t) = max(p_k(0) - t , G_k(t) , target_k)
+
+    where G_k(t) is the closest spot passenger k can reach behind the passengers ahead of it.
+    G_k only depends on the trajectory of passenger k-1 and on G_{k-1}, so the whole timeline
+    is built passenger by passenger with array operations instead of tick by tick.
+
+    Returns the number of ticks until everyone is seated and, for each of those ticks, the
+    number of passengers that sat down, were waiting and were moving at the end of the tick.
+    """
+    positions = np.asarray(positions , dtype=np.int64)
+    no_of_passengers = positions.size
+    if no_of_passengers == 0:
+        return 0 , np.zeros(0 , dtype=np.int64) , np.zeros(0 , dtype=np.int64) , np.zeros(0 , dtype=np.int64)
+
+    # Every passenger ahead delays the ones behind by at most a few ticks
+    horizon = int(positions.max()) + 3 * no_of_passengers + 3
+    while True:
+        ticks = np.arange(horizon + 1)
+        never = -(horizon + positions.max() + 2)   # Below any reachable spot
+        ahead = np.full(horizon + 1 , never)       # G_k, nothing ahead of the first passenger
+        seated_at = np.empty(no_of_passengers , dtype=np.int64)
+        waiting = np.zeros(horizon + 1 , dtype=np.int64)
+        moving = np.zeros(horizon + 1 , dtype=np.int64)
+
+        for k in range(no_of_passengers):
+            target = targets[k]
+            if is_standing[k]:
+                # Baggage is stowed already, sits down on the next tick
+                trajectory = np.full(horizon + 1 , target)
+                gone = 1
+            else:
+                trajectory = np.maximum(np.maximum(positions[k] - ticks , ahead) , target)
+                arrival = int(np.argmax(trajectory == target))
+                if trajectory[arrival] != target:
+                    break   # Horizon too short
+                gone = arrival + (2 if is_carrying_baggage[k] else 1)
+                if gone > horizon:
+                    break
+
+                # While on board: moving if the spot changed, waiting if not (and not stowing)
+                moved = trajectory[1:gone] < trajectory[:gone - 1]
+                moving[1:gone] += moved
+                waiting[1:gone] += ~moved
+                if is_carrying_baggage[k]:
+                    waiting[arrival + 1] -= 1   # Standing to stow the baggage
+
+            seated_at[k] = gone
+            # Once seated the passenger stops blocking, as if it kept moving forward
+            ghost = np.where(ticks < gone , trajectory , target + gone - 1 - ticks)
+            ahead = np.maximum(ghost + 1 , ahead)
+        else:
+            no_of_ticks = int(seated_at.max())
+            seated = np.bincount(seated_at , minlength=no_of_ticks + 1)
+            return no_of_ticks , seated[1:no_of_ticks + 1] , waiting[1:no_of_ticks + 1] , moving[1:no_of_ticks + 1]
+
+        horizon *= 2
+
+
+class ArrayBoardingState:
+    """Array-backed state engine of the airplane boarding simulation.
+
+    Keeps the lobby, the boarding line, the passenger status/baggage flags and the
+    seat occupancy in preallocated NumPy arrays and advances one tick with array
+    operations. It follows the same rules as the object model (`Lobby`, `BoardingArea`,
+    `AirplaneRow`), so both give identical observations, rewards and terminations.
+
+    Passenger ``p`` has seat number ``p + 1`` and belongs to row ``p // seats_per_row``
+    (0-based), which is also the aisle position where the passenger sits down.
+    """
+    EMPTY = -1
+
+    def __init__(self , num_rows : int , seats_per_row : int):
+        self.num_rows = num_rows
+        self.seats_per_row = seats_per_row
+        self.no_of_seats = num_rows * seats_per_row
+
+        passengers = np.arange(self.no_of_seats)
+        self.seat_no = passengers + 1
+        self.row_of = passengers // seats_per_row   # Aisle position of the passenger's row
+
+        self.status = np.empty(self.no_of_seats , dtype=np.int8)
+        self.is_carrying_baggage = np.empty(self.no_of_seats , dtype=bool)
+        self.seated = np.empty(self.no_of_seats , dtype=bool)
+        self.lobby_next = np.empty(num_rows , dtype=np.intp)   # Next passenger to leave each lobby row
+
+        # The line is the aisle (num_rows spots) followed by the queue waiting to enter it
+        self.line = np.empty(num_rows + self.no_of_seats + 1 , dtype=np.intp)
+        self._positions = np.arange(self.line.size)
+        self.reset()
+
+    def reset(self):
+        """Put every passenger back in the lobby and empty the aisle."""
+        self.status.fill(PassengerStatus.MOVING)
+        self.is_carrying_baggage.fill(True)
+        self.seated.fill(False)
+        self.lobby_next.fill(0)
+        self.line.fill(self.EMPTY)
+        self.line_len = self.num_rows
+
+        # Running counters, so that reward, mask and termination queries don't scan the arrays
+        self.no_of_seated = 0
+        self.no_of_lobby_passengers = self.no_of_seats
+        self.no_of_line_passengers = 0
+        self.status_counts = [0 , 0 , 0 , 0]   # Passengers in the line, indexed by PassengerStatus
+        self.available_rows = np.ones(self.num_rows , dtype=bool)
+
+    def remove_passenger(self , row_num : int):
+        """Remove the next passenger from a lobby row (1-based), returns EMPTY if the row is empty."""
+        row = row_num - 1
+        if not self.available_rows[row]:
+            return self.EMPTY
+        passenger = row * self.seats_per_row + self.lobby_next[row]
+        self.lobby_next[row] += 1
+        self.no_of_lobby_passengers -= 1
+        if self.lobby_next[row] == self.seats_per_row:
+            self.available_rows[row] = False
+        return passenger
+
+    def add_passenger(self , passenger : int):
+        """Add a passenger to the end of the boarding line."""
+        self.line[self.line_len] = passenger
+        self.line_len += 1
+        if passenger != self.EMPTY:
+            self.no_of_line_passengers += 1
+            self.status_counts[self.status[passenger]] += 1
+
+    def count_passengers(self):
+        """Count the total number of passengers in the lobby."""
+        return self.no_of_lobby_passengers
+
+    def is_onboarding(self):
+        """Check if Passengers are still onboarding."""
+        return self.no_of_line_passengers > 0
+
+    def is_boarding_complete(self):
+        """Check if boarding is complete."""
+        return self.count_passengers() == 0 and not self.is_onboarding()
+
+    def move(self):
+        """Advance the simulation by one tick: seat passengers at their row, then move the line forward."""
+        line = self.line[:self.line_len]
+
+        # Passengers standing at their own row either stow their baggage or sit down
+        aisle = line[:self.num_rows]
+        positions = np.flatnonzero(aisle != self.EMPTY)
+        passengers = aisle[positions]
+        at_row = self.row_of[passengers] == positions
+        positions , passengers = positions[at_row] , passengers[at_row]
+
+        stowing = self.is_carrying_baggage[passengers]
+        self.status[passengers[stowing]] = PassengerStatus.STANDING
+        self.is_carrying_baggage[passengers[stowing]] = False
+
+        sitting = passengers[~stowing]
+        self.status[sitting] = PassengerStatus.SEATED
+        self.seated[sitting] = True
+        aisle[positions[~stowing]] = self.EMPTY
+        self.no_of_seated += sitting.size
+        self.no_of_line_passengers -= sitting.size
+
+        self._move_forward(line)
+
+    def _move_forward(self , line):
+        """Move passengers forward in the boarding line, mirrors `BoardingArea.move_forward`."""
+        occupied = line != self.EMPTY
+        movable = occupied.copy()
+        movable[occupied] = self.status[line[occupied]] != PassengerStatus.STANDING
+        movable[0] = False   # The passenger at the front of the line never moves
+
+        # A passenger moves if the closest spot ahead that is not held by a movable passenger is empty.
+        # Every movable passenger in between moves along with it during the same tick.
+        blocker = np.maximum.accumulate(np.where(movable , -1 , self._positions[:line.size]))
+        moving = movable.copy()
+        moving[1:] &= ~occupied[blocker[:-1]]
+        waiting = movable & ~moving
+
+        self.status[line[waiting]] = PassengerStatus.WAITING
+        sources = np.flatnonzero(moving)
+        movers = line[sources]
+        self.status[movers] = PassengerStatus.MOVING
+        line[sources] = self.EMPTY
+        line[sources - 1] = movers
+
+        # Drop the empty spots of the queue behind the aisle
+        queue = line[self.num_rows:]
+        queued = queue[queue != self.EMPTY]
+        queue[:queued.size] = queued
+        self.line_len = self.num_rows + queued.size
+        self.line[self.line_len:line.size] = self.EMPTY
+
+        # Refresh the status counters once per tick
+        line = self.line[:self.line_len]
+        self.status_counts = np.bincount(self.status[line[line != self.EMPTY]] , minlength=4).tolist()
+
+    def no_of_waiting_passengers(self):
+        """Count the number of waiting passengers in the boarding line."""
+        return self.status_counts[PassengerStatus.WAITING]
+
+    def no_of_moving_passengers(self):
+        """Count the number of moving passengers in the boarding line."""
+        return self.status_counts[PassengerStatus.MOVING]
+
+    def reward(self):
+        """Calculate the reward for the current state."""
+        reward = self.no_of_seated
+        reward -= self.no_of_waiting_passengers() * 0.5
+        reward -= self.no_of_moving_passengers() * 0.2
+        return reward
+
+    def observation(self , observation : np.ndarray):
+        """Write the seat number and status of each spot of the boarding line to `observation` in place, padded with -1."""
+        observation.fill(-1)
+        line = self.line[:min(self.line_len , observation.size // 2)]
+        occupied = np.flatnonzero(line != self.EMPTY)
+        observation[2 * occupied] = self.seat_no[line[occupied]]
+        observation[2 * occupied + 1] = self.status[line[occupied]]
+        return observation
+
+    def action_masks(self) -> np.ndarray:
+        return self.available_rows
+
+    def render(self):
+        """Print the state in the same layout as the object model's terminal render."""
+        print("\n" + "="*50)
+        print("Lobby:")
+        for row in range(self.num_rows):
+            passengers = range(row * self.seats_per_row + self.lobby_next[row] , (row + 1) * self.seats_per_row)
+            print(f"Row {row + 1:02d}: " + " ".join(f"{self.seat_no[p]:02d}" for p in passengers))
+
+        print("\nBoarding Area:")
+        print("".join(" . " if p == self.EMPTY else f"{self.seat_no[p]:02d} " for p in self.line[:self.line_len]))
+
+        print("\nAirplane Seating:")
+        for row in range(self.num_rows):
+            seats = range(row * self.seats_per_row , (row + 1) * self.seats_per_row)
+            print(f"Row {row + 1:02d}: " + "".join(f"{self.seat_no[p]:02d} " if self.seated[p] else " . " for p in seats))
+        print("="*50 + "\n")
+
+
 class AirplaneBoardingEnv(gym.Env):
-    """Custom Environment that follows gym interface. This is a simple example of an airplane boarding simulation."""
+    """Custom Environment that follows gym interface. This is a simple example of an airplane boarding simulation.
+
+    `engine` selects the state representation: "object" keeps a Python object per passenger, seat and row,
+    "array" keeps the whole state in NumPy arrays (`ArrayBoardingState`), which is faster for larger cabins.
+
+    With `fast_forward=True`, the ticks left once the lobby is empty are not simulated one by one:
+    the remaining timeline is computed by `drain_timeline` and its reward is returned in one shot.
+    Intermediate states are not rendered in that mode.
+
+    `observation_mode` selects what step and reset return: "copy" gives a new array every time,
+    "view" gives a read-only view of the env's observation buffer, without any allocation.
+    """
 
     metadata = {"render_modes": ["human"], "render_fps": 4}
+    engines = ("object" , "array")
+    observation_modes = ("copy" , "view")
+
+    def __init__(self , render_mode=None , seats_per_row=6 , num_rows=30 , engine="object" , fast_forward=False , observation_mode="copy"):
 
-    def __init__(self , render_mode=None , seats_per_row=6 , num_rows=30):
+        if engine not in self.engines:
+            raise ValueError(f"engine must be one of {self.engines}, got {engine!r}")
+        if observation_mode not in self.observation_modes:
+            raise ValueError(f"observation_mode must be one of {self.observation_modes}, got {observation_mode!r}")
 
         self.seats_per_row = seats_per_row
         self.num_rows = num_rows
         self.no_of_seats = self.seats_per_row * self.num_rows
         self.render_mode = render_mode
-        
-        # Resets the environment to an initial state
-        self.reset()
+        self.engine = engine
+        self.fast_forward = fast_forward
+        self.observation_mode = observation_mode
 
         self.action_space = spaces.Discrete(self.num_rows)  # Action is to select a row to board from
 
@@ -187,91 +567,187 @@ class AirplaneBoardingEnv(gym.Env):
             shape=(self.no_of_seats * 2 ,),
             dtype=np.int32,
         )
+
+        # Observation buffer, updated in place as the passengers move
+        self._observation = np.full(self.observation_space.shape , -1 , dtype=self.observation_space.dtype)
+        self._observation_view = self._observation.view()
+        self._observation_view.flags.writeable = False
+
+        self.lobby = None
+        if self.engine == "array":
+            self.state = ArrayBoardingState(self.num_rows , self.seats_per_row)
+
+        # Resets the environment to an initial state
+        self.reset()
         
 
     def reset(self, seed=None, options=None):
         super().reset(seed=seed)
 
-        # Initialize the environment state
-        self.lobby = Lobby(self.num_rows , self.seats_per_row)
-        self.airplane = [AirplaneRow(i , self.seats_per_row) for i in range(1 , self.num_rows + 1)]
-        self.boarding_area = BoardingArea(self.num_rows)
+        # Initialize the environment state, the objects are created once and then reset in place
+        if self.engine == "array":
+            self.state.reset()
+        elif self.lobby is None:
+            self.lobby = Lobby(self.num_rows , self.seats_per_row)
+            self.airplane = [AirplaneRow(i , self.seats_per_row) for i in range(1 , self.num_rows + 1)]
+            self.boarding_area = BoardingArea(self.num_rows , self._observation)
+
+            # Passenger -> seat mapping, the objects are kept across resets so it is built once
+            for lobby_row , airplane_row in zip(self.lobby.lobby_rows , self.airplane):
+                for passenger in lobby_row.all_passengers:
+                    passenger.seat = airplane_row.seat_index[passenger.seat_no]
+        else:
+            self.lobby.reset()
+            for airplane_row in self.airplane:
+                airplane_row.reset()
+            self.boarding_area.reset()
+        self.no_of_seated = 0
 
         self.render()
 
         return self._getobservation() , {}
     
     def _getobservation(self):
-        """Get the Observation of the current state."""
-        observation = []
+        """Get the Observation of the current state.
 
-        for passenger in self.boarding_area.line:
-            if passenger is None:
-                observation.append(-1)
-                observation.append(-1)
-            else:
-                observation.append(passenger.seat_no)
-                observation.append(passenger.status.value)
+        With observation_mode="copy" every call returns a new array, with "view" it returns the same
+        read-only view of the env's observation buffer, which changes on the next step or reset.
+        """
+        if self.engine == "array":
+            self.state.observation(self._observation)
+        else:
+            self.boarding_area.update_observation()
 
-        return np.array(observation , dtype=np.int32)
+        if self.observation_mode == "view":
+            return self._observation_view
+        return self._observation.copy()
 
     # Takes an action and returns the next state, reward, observation, and info
 
     def step(self, row_num):
-        assert row_num>=0 and row_num<self.num_of_rows, f"Invalid row number {row_num}"
+        assert row_num>=0 and row_num<self.num_rows, f"Invalid row number {row_num}"
 
         reward = 0
 
-        passenger = self.lobby.remove_passenger(row_num)
-        self.boarding_line.add_passenger(passenger)
+        # Actions are 0-based, lobby rows are numbered from 1
+        if self.engine == "array":
+            self.state.add_passenger(self.state.remove_passenger(row_num + 1))
+            lobby_count = self.state.count_passengers()
+        else:
+            passenger = self.lobby.remove_passenger(row_num + 1)
+            self.boarding_area.add_passenger(passenger)
+            lobby_count = self.lobby.count_passengers()
 
         # If there are passengers in the lobby, move the line once
-        if self.lobby.count_passengers()>0:
+        if lobby_count>0:
             self._move()
-            reward = self._calculate_reward()
+            reward = self._reward()
+        elif self.fast_forward:
+            reward = self._fast_forward()
         else:
             # No more passengers in the lobby, so no more actions to choose from, move the line until all passengers are seated
-            while self.is_onboarding():
+            while not self.is_boarding_complete():
                 self._move()
-                reward += self._calculate_reward()
+                reward += self._reward()
 
-        if self.is_onboarding():
-            terminated = False
-        else:
-            terminated = True
+        terminated = self.is_boarding_complete()
 
         # Gym requires returning the observation, reward, terminated, truncated, and info dictionary.
-        return self._get_observation(), reward, terminated, False, {}
+        return self._getobservation(), reward, terminated, False, {}
     
     def _move(self):
 
-        for row_num, passenger in enumerate(self.boarding_line.line):
+        if self.engine == "array":
+            self.state.move()
+            self.render()
+            return
+
+        for row_num, passenger in enumerate(self.boarding_area.line):
             if passenger is None:
                 continue
 
             # If outside of airplane's aisle
-            if row_num >= len(self.airplane_rows):
+            if row_num >= len(self.airplane):
                 break
 
+            # Passengers only sit down at their own row
+            if passenger.row_no - 1 != row_num:
+                continue
+
             # Try to sit passenger, if successful, remove from line
-            if self.airplane_rows[row_num].try_sit_passenger(passenger):
-                self.boarding_line.line[row_num] = None
+            status = passenger.status
+            seated = passenger.seat.seat_passenger(passenger)
+            self.boarding_area.status_changed(row_num , status)
+            if seated:
+                self.boarding_area.remove_passenger(row_num)
+                self.no_of_seated += 1
 
         # Move line forward
-        self.boarding_line.move_forward()
+        self.boarding_area.move_forward()
 
         self.render()
 
 
+    def _fast_forward(self):
+        """Seat every passenger left in the line at once, returns the reward the ticks would have given."""
+        if self.engine == "array":
+            state = self.state
+            line = state.line[:state.line_len]
+            positions = np.flatnonzero(line != state.EMPTY)
+            passengers = line[positions]
+            targets = state.row_of[passengers]
+            is_carrying_baggage = state.is_carrying_baggage[passengers]
+            is_standing = state.status[passengers] == PassengerStatus.STANDING
+            no_of_seated = state.no_of_seated
+        else:
+            positions = [i for i , passenger in enumerate(self.boarding_area.line) if passenger is not None]
+            passengers = [self.boarding_area.line[i] for i in positions]
+            targets = [passenger.row_no - 1 for passenger in passengers]
+            is_carrying_baggage = [passenger.is_carrying_baggage for passenger in passengers]
+            is_standing = [passenger.status == PassengerStatus.STANDING for passenger in passengers]
+            no_of_seated = self.no_of_seated
+
+        no_of_ticks , seated , waiting , moving = drain_timeline(positions , targets , is_carrying_baggage , is_standing)
+
+        # Same arithmetic, in the same order, as calling _reward after every tick
+        reward = 0
+        for tick in range(no_of_ticks):
+            no_of_seated += int(seated[tick])
+            tick_reward = no_of_seated
+            tick_reward -= int(waiting[tick]) * 0.5
+            tick_reward -= int(moving[tick]) * 0.2
+            reward += tick_reward
+
+        # Leave the state as the ticks would have: everyone seated, empty line
+        if self.engine == "array":
+            state.status[passengers] = PassengerStatus.SEATED
+            state.is_carrying_baggage[passengers] = False
+            state.seated[passengers] = True
+            state.line[positions] = state.EMPTY
+            state.line_len = self.num_rows
+            state.no_of_seated = no_of_seated
+            state.no_of_line_passengers = 0
+            state.status_counts = [0 , 0 , 0 , 0]
+        else:
+            for i , passenger in zip(positions , passengers):
+                passenger.is_carrying_baggage = False
+                passenger.seat.seat_passenger(passenger)
+                self.boarding_area.remove_passenger(i)
+            self.boarding_area.status_counts = [0 , 0 , 0 , 0]
+            del self.boarding_area.line[self.num_rows:]
+            self.no_of_seated = no_of_seated
+
+        self.render()
+
+        return reward
+
     def _reward(self):
         """Calculate the reward for the current state."""
-        reward = 0
+        if self.engine == "array":
+            return self.state.reward()
 
         # Reward for each seated passenger
-        for airplane_row in self.airplane:
-            for seat in airplane_row.seats:
-                if seat.passenger is not None and seat.passenger.status == PassengerStatus.SEATED:
-                    reward += 1
+        reward = self.no_of_seated
 
         # Penalty for each waiting passenger in the boarding area
         reward -= self.boarding_area.no_of_waiting_passengers() * 0.5
@@ -283,6 +759,9 @@ class AirplaneBoardingEnv(gym.Env):
 
     def is_boarding_complete(self):
         """Check if boarding is complete."""
+        if self.engine == "array":
+            return self.state.is_boarding_complete()
+
         if self.lobby.count_passengers() == 0 and not self.boarding_area.is_onboarding():
             return True
         return False
@@ -292,7 +771,10 @@ class AirplaneBoardingEnv(gym.Env):
         if self.render_mode is None:
             return
         
-        if self.render_mode == "terminal":
+        if self.render_mode == "terminal" and self.engine == "array":
+            self.state.render()
+
+        elif self.render_mode == "terminal":
             print("\n" + "="*50)
             print("Lobby:")
             for row in self.lobby.lobby_rows:
@@ -320,16 +802,12 @@ class AirplaneBoardingEnv(gym.Env):
 
     # This method is used to mask the actions that are allowed
     # This will return True for allowed actions and False for disallowed actions
-    def action_masks(self) -> list[bool]:
-        mask = []
-
-        for row in self.lobby.lobby_rows:
-            if len(row.passengers) == 0:
-                mask.append(False)
-            else:
-                mask.append(True)
+    # The mask is kept up to date by the lobby, copy it if you need to keep it across steps
+    def action_masks(self) -> np.ndarray:
+        if self.engine == "array":
+            return self.state.action_masks()
 
-        return mask
+        return self.lobby.available_rows
 
 
 # Check the validity of the custom environment
@@ -348,7 +826,7 @@ def custom_check_env():
 if __name__ == "__main__":
     # my_check_env()
 
-    env = gym.make('airplane-boarding-v0', num_of_rows=10, seats_per_row=5, render_mode='terminal')
+    env = gym.make('AirplaneBoarding-v0', num_rows=10, seats_per_row=5, render_mode='terminal')
 
     observation, _ = env.reset()
     terminated = False
@@ -0,0 +1,150 @@
+import numpy as np
+
+from vec_airplane_boarding import AirplaneBoardingVecEnv
+
+
+class BoardingStrategy:
+    """Non-learned boarding policy, picks the next lobby row to board from the action masks.
+
+    An action only chooses a lobby row, passengers leave a row in seat order. The strategies
+    below are the row-level versions of the classic seat-level ones: they keep count of the
+    passengers they sent from each row and, for every cabin, pick the available row with the
+    lowest `priority()`. Works with one cabin (a mask of shape (num_rows,), as returned by
+    `AirplaneBoardingEnv.action_masks`) or a batch (num_envs, num_rows).
+    """
+
+    def __init__(self , num_rows , seats_per_row , num_envs=1 , seed=None):
+        self.num_rows = num_rows
+        self.seats_per_row = seats_per_row
+        self.num_envs = num_envs
+        self.rng = np.random.default_rng(seed)
+        self.rows = np.arange(num_rows)
+        self.boarded = np.zeros((num_envs , num_rows) , dtype=np.intp)   # Passengers sent from each row
+        self._envs = np.arange(num_envs)
+
+    def reset(self , envs=None):
+        """Start a new episode for the given cabins (all by default)."""
+        self.boarded[self._envs if envs is None else envs] = 0
+
+    def priority(self):
+        """Array (num_envs, num_rows), rows with a lower value board first."""
+        raise NotImplementedError
+
+    def __call__(self , masks):
+        masks = np.asarray(masks , dtype=bool)
+        priority = np.where(masks.reshape(self.num_envs , self.num_rows) , self.priority() , np.inf)
+        actions = priority.argmin(axis=1)
+        self.boarded[self._envs , actions] += 1
+        return actions if masks.ndim == 2 else int(actions[0])
+
+
+class BackToFront(BoardingStrategy):
+    """Board the back rows first."""
+
+    def priority(self):
+        return np.broadcast_to(-self.rows , (self.num_envs , self.num_rows))
+
+
+class RandomBoarding(BoardingStrategy):
+    """Board from a random row that still has passengers."""
+
+    def priority(self):
+        return self.rng.random((self.num_envs , self.num_rows))
+
+
+class OutsideIn(BoardingStrategy):
+    """WilMA: board in passes, each pass sends the next seat of every row, back rows first.
+
+    The first pass boards the first seat of each row (window), the next ones move inwards.
+    """
+
+    def priority(self):
+        return self.boarded * self.num_rows - self.rows
+
+
+class Steffen(BoardingStrategy):
+    """Steffen method: like WilMA, but each pass boards every other row, back to front.
+
+    Passengers one row apart don't block each other while stowing their baggage.
+    """
+
+    def priority(self):
+        back_parity = self.rows % 2 != (self.num_rows - 1) % 2
+        return self.boarded * 2 * self.num_rows + back_parity * self.num_rows - self.rows
+
+
+class ReversePyramid(BoardingStrategy):
+    """Reverse pyramid: diagonal zones, back rows' first seats first, front rows' last seats last."""
+
+    def priority(self):
+        return self.boarded / self.seats_per_row + (self.num_rows - 1 - self.rows) / self.num_rows
+
+
+strategies = {
+    "back_to_front": BackToFront,
+    "random": RandomBoarding,
+    "outside_in": OutsideIn,
+    "steffen": Steffen,
+    "reverse_pyramid": ReversePyramid,
+}
+
+
+def evaluate(strategy , num_rows=10 , seats_per_row=5 , episodes=1000 , num_envs=256 , seed=0):
+    """Run `episodes` episodes of a strategy (name or class) on a render-free vectorized env.
+
+    Returns the mean and percentiles of the total boarding ticks and of the episode reward.
+    """
+    strategy_cls = strategies[strategy] if isinstance(strategy , str) else strategy
+    num_envs = min(num_envs , episodes)
+
+    env = AirplaneBoardingVecEnv(num_envs=num_envs , num_rows=num_rows , seats_per_row=seats_per_row)
+    policy = strategy_cls(num_rows , seats_per_row , num_envs=num_envs , seed=seed)
+
+    # Each cabin runs a fixed share of the episodes, so short episodes aren't over-represented
+    quota = np.full(num_envs , episodes // num_envs)
+    quota[:episodes % num_envs] += 1
+
+    ticks , rewards = [] , []
+    episode_rewards = np.zeros(num_envs)
+    env.reset()
+    while (quota > 0).any():
+        _ , step_rewards , dones , infos = env.step(policy(env.action_masks()))
+        episode_rewards += step_rewards
+
+        for env_idx in np.flatnonzero(dones):
+            if quota[env_idx] > 0:
+                ticks.append(infos[env_idx]["ticks"])
+                rewards.append(episode_rewards[env_idx])
+                quota[env_idx] -= 1
+        episode_rewards[dones] = 0
+        policy.reset(dones)
+
+    ticks , rewards = np.array(ticks) , np.array(rewards)
+    return {
+        "strategy": strategy_cls.__name__,
+        "episodes": episodes,
+        "mean_ticks": ticks.mean(),
+        "p50_ticks": np.percentile(ticks , 50),
+        "p90_ticks": np.percentile(ticks , 90),
+        "p99_ticks": np.percentile(ticks , 99),
+        "mean_reward": rewards.mean(),
+        "p50_reward": np.percentile(rewards , 50),
+        "p10_reward": np.percentile(rewards , 10),
+        "p1_reward": np.percentile(rewards , 1),
+    }
+
+
+def compare(num_rows=10 , seats_per_row=5 , episodes=1000 , num_envs=256 , seed=0):
+    """Evaluate every strategy and print one line per strategy."""
+    results = [evaluate(name , num_rows , seats_per_row , episodes , num_envs , seed) for name in strategies]
+
+    print(f"{'strategy':<16} {'mean ticks':>10} {'p50':>6} {'p99':>6} {'mean reward':>12} {'p1':>10}")
+    for result in results:
+        print(f"{result['strategy']:<16} {result['mean_ticks']:>10.1f} {result['p50_ticks']:>6.0f} {result['p99_ticks']:>6.0f} "
+              f"{result['mean_reward']:>12.1f} {result['p1_reward']:>10.1f}")
+
+    return results
+
+
+if __name__ == '__main__':
+    compare(num_rows=10, seats_per_row=5)
@@ -0,0 +1,105 @@
+import csv
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from stable_baselines3.common.callbacks import BaseCallback
+
+sweep_dir = os.path.join("models", "sweep")
+results_file = "sweep_results.csv"
+
+
+class RewardCurveCallback(BaseCallback):
+    """Record the mean episode reward of the last episodes after every rollout."""
+
+    def __init__(self):
+        super().__init__()
+        self.curve = []   # (timesteps, mean episode reward)
+
+    def _on_step(self):
+        return True
+
+    def _on_rollout_end(self):
+        if len(self.model.ep_info_buffer) > 0:
+            mean_reward = sum(ep_info["r"] for ep_info in self.model.ep_info_buffer) / len(self.model.ep_info_buffer)
+            self.curve.append((self.num_timesteps, float(mean_reward)))
+
+
+def make_configs(cabin_sizes, ent_coefs, seeds):
+    """Every combination of (num_rows, seats_per_row), ent_coef and seed."""
+    return [
+        {"num_rows": num_rows, "seats_per_row": seats_per_row, "ent_coef": ent_coef, "seed": seed}
+        for (num_rows, seats_per_row), ent_coef, seed in itertools.product(cabin_sizes, ent_coefs, seeds)
+    ]
+
+
+def run_job(config, total_timesteps, threads_per_job):
+    """Train and test one configuration, runs in a worker process."""
+
+    # CPU budget of the job. torch is already imported (by stable_baselines3) when the pool forks, so
+    # OMP_NUM_THREADS would come too late, set_num_threads resizes its thread pool
+    import torch
+    torch.set_num_threads(threads_per_job)
+
+    from agent import train, test
+
+    name = "rows{num_rows}_seats{seats_per_row}_ent{ent_coef}_seed{seed}".format(**config)
+    job_dir = os.path.join(sweep_dir, name)
+    curve_callback = RewardCurveCallback()
+
+    start = time.perf_counter()
+    model = train(**config, total_timesteps=total_timesteps, model_dir=job_dir,
+                  log_dir=os.path.join(job_dir, "logs"), verbose=0, callback=curve_callback)
+    wall_time = time.perf_counter() - start
+
+    test_reward = test("final_model", render=False, num_rows=config["num_rows"],
+                       seats_per_row=config["seats_per_row"], model_dir=job_dir)
+
+    return {
+        **config,
+        "timesteps": model.num_timesteps,
+        "wall_time": wall_time,
+        "steps_per_sec": model.num_timesteps / wall_time,
+        "final_mean_reward": curve_callback.curve[-1][1] if curve_callback.curve else None,
+        "test_reward": test_reward,
+        "reward_curve": json.dumps(curve_callback.curve),
+    }
+
+
+def sweep(configs, total_timesteps=200_000, threads_per_job=1, max_workers=None, results_path=results_file):
+    """Run every configuration on a local process pool and write one row per job to a CSV table.
+
+    Each job gets `threads_per_job` CPU threads, by default the pool runs as many jobs at
+    once as fit in the cores of the machine.
+    """
+    if not configs:
+        raise ValueError("configs is empty, there is nothing to sweep")
+    if max_workers is None:
+        max_workers = max(1, (os.cpu_count() or 1) // threads_per_job)
+
+    results = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        jobs = {executor.submit(run_job, config, total_timesteps, threads_per_job): config for config in configs}
+        for job in as_completed(jobs):
+            result = job.result()
+            print(f"Done {jobs[job]}: {result['steps_per_sec']:.0f} steps/sec, test reward {result['test_reward']:.1f}")
+            results.append(result)
+
+    results.sort(key=lambda result: [result[key] for key in ("num_rows", "seats_per_row", "ent_coef", "seed")])
+    with open(results_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(results[0].keys()))
+        writer.writeheader()
+        writer.writerows(results)
+
+    return results
+
+
+if __name__ == '__main__':
+    configs = make_configs(
+        cabin_sizes=[(10, 5), (20, 6), (30, 6)],
+        ent_coefs=[0.01, 0.05],
+        seeds=[0, 1, 2],
+    )
+    sweep(configs, total_timesteps=500_000)
@@ -0,0 +1,254 @@
+import gymnasium.spaces as spaces
+import numpy as np
+from stable_baselines3.common.vec_env import VecEnv
+
+from airplane_boarding import PassengerStatus
+
+
+class BatchedBoardingState:
+    """State of N airplane boarding simulations stacked in NumPy arrays.
+
+    Every array has the cabin as its leading dimension, so one call to `move` advances
+    all the given cabins. Follows the same rules and passenger numbering as `ArrayBoardingState`.
+    """
+    EMPTY = -1
+
+    def __init__(self , num_envs : int , num_rows : int , seats_per_row : int):
+        self.num_envs = num_envs
+        self.num_rows = num_rows
+        self.seats_per_row = seats_per_row
+        self.no_of_seats = num_rows * seats_per_row
+
+        passengers = np.arange(self.no_of_seats)
+        self.seat_no = passengers + 1
+        self.row_of = passengers // seats_per_row   # Aisle position of the passenger's row
+
+        self.status = np.empty((num_envs , self.no_of_seats) , dtype=np.int8)
+        self.is_carrying_baggage = np.empty((num_envs , self.no_of_seats) , dtype=bool)
+        self.no_of_seated = np.empty(num_envs , dtype=np.intp)
+        self.lobby_next = np.empty((num_envs , num_rows) , dtype=np.intp)   # Next passenger to leave each lobby row
+
+        # Each line is the aisle (num_rows spots) followed by the queue waiting to enter it
+        self.line = np.empty((num_envs , num_rows + self.no_of_seats + 1) , dtype=np.intp)
+        self.line_len = np.empty(num_envs , dtype=np.intp)
+        self.ticks = np.empty(num_envs , dtype=np.intp)   # Ticks since the start of the episode
+        self._positions = np.arange(self.line.shape[1])
+        self._envs = np.arange(num_envs)
+
+        self.reset()
+
+    def reset(self , envs=None):
+        """Reset the given cabins (all cabins by default) to their initial state."""
+        envs = self._envs if envs is None else envs
+        self.status[envs] = PassengerStatus.MOVING
+        self.is_carrying_baggage[envs] = True
+        self.no_of_seated[envs] = 0
+        self.lobby_next[envs] = 0
+        self.line[envs] = self.EMPTY
+        self.line_len[envs] = self.num_rows
+        self.ticks[envs] = 0
+
+    def board(self , rows):
+        """Move the next passenger of lobby row `rows[i]` (0-based) to the end of line i."""
+        taken = self.lobby_next[self._envs , rows]
+        valid = taken < self.seats_per_row
+        passengers = np.where(valid , rows * self.seats_per_row + taken , self.EMPTY)
+        self.lobby_next[self._envs[valid] , rows[valid]] += 1
+
+        self.line[self._envs , self.line_len] = passengers
+        self.line_len += 1
+
+    def count_passengers(self):
+        """Number of passengers left in each lobby."""
+        return self.no_of_seats - self.lobby_next.sum(axis=1)
+
+    def is_boarding_complete(self):
+        """Boolean array, True for the cabins where every passenger is seated."""
+        return self.no_of_seated == self.no_of_seats
+
+    def move(self , envs):
+        """Advance the given cabins by one tick: seat passengers at their row, then move the lines forward."""
+        width = self.line_len[envs].max()
+        line = self.line[envs , :width]
+        status = self.status[envs]
+        baggage = self.is_carrying_baggage[envs]
+        cabins = np.arange(envs.size)[: , None]
+
+        # Passengers standing at their own row either stow their baggage or sit down
+        aisle = line[: , :self.num_rows]
+        at_row = (aisle != self.EMPTY) & (self.row_of[aisle] == self._positions[:aisle.shape[1]])
+        env_idx , positions = np.nonzero(at_row)
+        passengers = aisle[env_idx , positions]
+
+        stowing = baggage[env_idx , passengers]
+        status[env_idx[stowing] , passengers[stowing]] = PassengerStatus.STANDING
+        baggage[env_idx[stowing] , passengers[stowing]] = False
+
+        sitting = ~stowing
+        status[env_idx[sitting] , passengers[sitting]] = PassengerStatus.SEATED
+        aisle[env_idx[sitting] , positions[sitting]] = self.EMPTY
+        self.no_of_seated[envs] += np.bincount(env_idx[sitting] , minlength=envs.size)
+
+        # Move the lines forward, see `ArrayBoardingState._move_forward`
+        occupied = line != self.EMPTY
+        movable = occupied & (status[cabins , line] != PassengerStatus.STANDING)
+        movable[: , 0] = False
+
+        blocker = np.maximum.accumulate(np.where(movable , -1 , self._positions[:width]) , axis=1)
+        moving = movable.copy()
+        moving[: , 1:] &= ~np.take_along_axis(occupied , blocker[: , :-1] , axis=1)
+
+        env_idx , blocked = np.nonzero(movable & ~moving)
+        status[env_idx , line[env_idx , blocked]] = PassengerStatus.WAITING
+        env_idx , sources = np.nonzero(moving)
+        movers = line[env_idx , sources]
+        status[env_idx , movers] = PassengerStatus.MOVING
+        line[env_idx , sources] = self.EMPTY
+        line[env_idx , sources - 1] = movers
+
+        # Drop the empty spots of the queues behind the aisle
+        queue = line[: , self.num_rows:]
+        order = np.argsort(queue == self.EMPTY , axis=1 , kind="stable")
+        line[: , self.num_rows:] = np.take_along_axis(queue , order , axis=1)
+
+        self.line[envs , :width] = line
+        self.line_len[envs] = self.num_rows + (queue != self.EMPTY).sum(axis=1)
+        self.status[envs] = status
+        self.is_carrying_baggage[envs] = baggage
+        self.ticks[envs] += 1
+
+    def reward(self , envs):
+        """Reward of the current state of the given cabins, same formula as `AirplaneBoardingEnv._reward`."""
+        line = self.line[envs , :self.line_len[envs].max()]
+        occupied = line != self.EMPTY
+        status = np.where(occupied , self.status[envs[: , None] , line] , -1)
+
+        reward = self.no_of_seated[envs].astype(np.float64)
+        reward -= (status == PassengerStatus.WAITING).sum(axis=1) * 0.5
+        reward -= (status == PassengerStatus.MOVING).sum(axis=1) * 0.2
+        return reward
+
+    def observation(self , envs=None):
+        """Seat number and status of each spot of the boarding lines, padded with -1."""
+        envs = self._envs if envs is None else envs
+        observation = np.full((envs.size , self.no_of_seats * 2) , -1 , dtype=np.int32)
+        line = self.line[envs , :self.no_of_seats]
+        env_idx , positions = np.nonzero(line != self.EMPTY)
+        passengers = line[env_idx , positions]
+        observation[env_idx , 2 * positions] = self.seat_no[passengers]
+        observation[env_idx , 2 * positions + 1] = self.status[envs[env_idx] , passengers]
+        return observation
+
+    def action_masks(self):
+        """Boolean array (num_envs, num_rows), True for the lobby rows that still have passengers."""
+        return self.lobby_next < self.seats_per_row
+
+
+class AirplaneBoardingVecEnv(VecEnv):
+    """Native vectorized version of `AirplaneBoardingEnv` for Stable Baselines 3.
+
+    Holds `num_envs` cabins in a `BatchedBoardingState` and advances all of them in one
+    `step(actions)` call, without subprocesses. Each cabin gives the same observations,
+    rewards and terminations as `AirplaneBoardingEnv`. Finished episodes are reset
+    automatically, their last observation is stored in `info["terminal_observation"]`
+    and the number of ticks it took to board everyone in `info["ticks"]`.
+
+    The cabins share one set of attributes (`num_rows`, `render_mode`, ...): `get_attr` returns
+    the shared value for each requested cabin and `set_attr` only sets attributes for the whole
+    batch. `env_method` calls the method once for the whole batch as well.
+    """
+
+    def __init__(self , num_envs=12 , seats_per_row=6 , num_rows=30):
+        self.seats_per_row = seats_per_row
+        self.num_rows = num_rows
+        self.no_of_seats = seats_per_row * num_rows
+        self.render_mode = None
+        self.state = BatchedBoardingState(num_envs , num_rows , seats_per_row)
+
+        observation_space = spaces.Box(
+            low=-1,
+            high=self.no_of_seats ,
+            shape=(self.no_of_seats * 2 ,),
+            dtype=np.int32,
+        )
+        super().__init__(num_envs , observation_space , spaces.Discrete(num_rows))
+        self._actions = None
+
+    def reset(self):
+        self.state.reset()
+        self._reset_seeds()
+        self._reset_options()
+        return self.state.observation()
+
+    def step_async(self , actions):
+        self._actions = np.asarray(actions , dtype=np.intp).reshape(self.num_envs)
+
+    def step_wait(self):
+        assert ((self._actions >= 0) & (self._actions < self.num_rows)).all() , f"Invalid row number in {self._actions}"
+
+        state = self.state
+        state.board(self._actions)
+
+        # Every cabin moves its line once
+        envs = np.arange(self.num_envs)
+        state.move(envs)
+        rewards = state.reward(envs)
+
+        # Cabins with an empty lobby keep moving their line until all passengers are seated
+        draining = envs[state.count_passengers() == 0]
+        draining = draining[~state.is_boarding_complete()[draining]]
+        while draining.size:
+            state.move(draining)
+            rewards[draining] += state.reward(draining)
+            draining = draining[~state.is_boarding_complete()[draining]]
+
+        dones = state.is_boarding_complete()
+        observations = state.observation()
+        infos = [{} for _ in range(self.num_envs)]
+
+        finished = np.flatnonzero(dones)
+        for env_idx in finished:
+            infos[env_idx]["terminal_observation"] = observations[env_idx].copy()
+            infos[env_idx]["ticks"] = int(state.ticks[env_idx])
+        if finished.size:
+            state.reset(finished)
+            observations[finished] = state.observation(finished)
+
+        return observations , rewards.astype(np.float32) , dones , infos
+
+    def action_masks(self):
+        return self.state.action_masks()
+
+    def close(self):
+        pass
+
+    def _indices(self , indices):
+        if indices is None:
+            return range(self.num_envs)
+        if isinstance(indices , int):
+            indices = [indices]
+        for i in indices:
+            if not -self.num_envs <= i < self.num_envs:
+                raise IndexError(f"cabin index {i} out of range for {self.num_envs} cabins")
+        return indices
+
+    def get_attr(self , attr_name , indices=None):
+        """The shared value of an attribute, once per requested cabin."""
+        value = getattr(self , attr_name)
+        return [value for _ in self._indices(indices)]
+
+    def set_attr(self , attr_name , value , indices=None):
+        """Set an attribute of the whole batch, the cabins can't hold different values."""
+        if {i % self.num_envs for i in self._indices(indices)} != set(range(self.num_envs)):
+            raise ValueError(f"{attr_name!r} is shared by all cabins, it can only be set for the whole batch (indices=None)")
+        setattr(self , attr_name , value)
+
+    def env_method(self , method_name , *method_args , indices=None , **method_kwargs):
+        """Call a method for the whole batch, batched results are split per cabin."""
+        result = getattr(self , method_name)(*method_args , **method_kwargs)
+        if isinstance(result , np.ndarray) and result.shape[:1] == (self.num_envs ,):
+            return [result[i] for i in self._indices(indices)]
+        return [result for _ in self._indices(indices)]
+
+    def env_is_wrapped(self , wrapper_class , indices=None):
+        return [False for _ in self._indices(indices)]
@@ -0,0 +1,193 @@
+"""Step-throughput benchmarks for the Reinforcement environments.
+
+Measures steps/sec, resets/sec, p50/p99 step latency and peak memory of the airplane
+boarding env at several cabin sizes and of the Taxi-v3/FrozenLake-v1 envs, plus the
+end-to-end training loops of taxi_drop/main.py and frozen_lake/main.py. Results are
+saved as JSON and can be compared against a stored baseline:
+
+    python benchmark.py --output bench.json --baseline bench_baseline.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import gymnasium as gym
+import numpy as np
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(here, "airplane_bording"))
+sys.path.append(os.path.dirname(here))
+
+from airplane_boarding import AirplaneBoardingEnv
+from metrics import wait_for_plots
+from scripts import load_script
+
+# Higher is better for throughput, lower is better for latency and memory
+higher_is_better = ("steps_per_sec", "resets_per_sec", "episodes_per_sec")
+lower_is_better = ("p50_step_us", "p99_step_us", "peak_memory_kb")
+
+
+def bench_env(make_env, steps=5000, resets=200, memory_steps=500, seed=0):
+    """Random (masked if the env has action masks) actions, returns throughput and latency stats."""
+    env = make_env()
+    rng = np.random.default_rng(seed)
+    env.action_space.seed(seed)
+    has_masks = hasattr(env.unwrapped, "action_masks")
+
+    def action():
+        if has_masks:
+            return int(rng.choice(np.flatnonzero(env.unwrapped.action_masks())))
+        return env.action_space.sample()
+
+    def run_steps(n):
+        latencies = np.empty(n, dtype=np.int64)
+        env.reset(seed=seed)
+        for i in range(n):
+            a = action()
+            start = time.perf_counter_ns()
+            _, _, terminated, truncated, _ = env.step(a)
+            latencies[i] = time.perf_counter_ns() - start
+            if terminated or truncated:
+                env.reset()
+        return latencies
+
+    latencies = run_steps(steps)
+
+    start = time.perf_counter()
+    for _ in range(resets):
+        env.reset()
+    reset_time = time.perf_counter() - start
+
+    # Separate pass, tracemalloc slows down every allocation
+    tracemalloc.start()
+    run_steps(memory_steps)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    env.close()
+
+    return {
+        "steps_per_sec": steps / (latencies.sum() / 1e9),
+        "resets_per_sec": resets / reset_time,
+        "p50_step_us": float(np.percentile(latencies, 50)) / 1e3,
+        "p99_step_us": float(np.percentile(latencies, 99)) / 1e3,
+        "peak_memory_kb": peak / 1024,
+    }
+
+
+def bench_training(script, episodes):
+    """Time `run(episodes)` of a tabular training script, in a temporary directory for its outputs."""
+    module = load_script(os.path.basename(os.path.dirname(script)), script)
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            with contextlib.redirect_stdout(None):
+                start = time.perf_counter()
+                module.run(episodes)
+                wait_for_plots()   # The plot goes to the temporary directory
+                elapsed = time.perf_counter() - start
+
+                # Separate run for the memory, tracemalloc slows down every allocation
+                tracemalloc.start()
+                module.run(episodes)
+                wait_for_plots()
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+        finally:
+            os.chdir(cwd)
+
+    return {
+        "episodes_per_sec": episodes / elapsed,
+        "peak_memory_kb": peak / 1024,
+    }
+
+
+def airplane_benchmarks(cabin_sizes, steps):
+    benchmarks = {}
+    for num_rows, seats_per_row in cabin_sizes:
+        for engine, fast_forward in (("object", False), ("array", True)):
+            name = f"airplane_{engine}{'_ff' if fast_forward else ''}_{num_rows}x{seats_per_row}"
+            make_env = lambda num_rows=num_rows, seats_per_row=seats_per_row, engine=engine, fast_forward=fast_forward: AirplaneBoardingEnv(
+                num_rows=num_rows, seats_per_row=seats_per_row, engine=engine, fast_forward=fast_forward)
+            benchmarks[name] = lambda make_env=make_env: bench_env(make_env, steps=steps)
+    return benchmarks
+
+
+def all_benchmarks(quick=False):
+    steps = 1000 if quick else 5000
+    episodes = 300 if quick else 2000
+
+    benchmarks = airplane_benchmarks([(10, 5), (30, 6), (60, 8)], steps)
+    benchmarks["taxi_env"] = lambda: bench_env(lambda: gym.make('Taxi-v3'), steps=steps * 4)
+    benchmarks["frozen_lake_env"] = lambda: bench_env(lambda: gym.make('FrozenLake-v1', map_name="8x8", is_slippery=True), steps=steps * 4)
+    benchmarks["taxi_training"] = lambda: bench_training(os.path.join(here, "taxi_drop", "main.py"), episodes)
+    benchmarks["frozen_lake_training"] = lambda: bench_training(os.path.join(here, "frozen_lake", "main.py"), episodes)
+    return benchmarks
+
+
+def run_benchmarks(names=None, quick=False):
+    benchmarks = all_benchmarks(quick)
+    results = {}
+    for name, benchmark in benchmarks.items():
+        if names and name not in names:
+            continue
+        results[name] = benchmark()
+        print(f"{name:<28} " + "  ".join(f"{metric}={value:,.1f}" for metric, value in results[name].items()))
+
+    return {
+        "platform": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "gymnasium": gym.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+        },
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+
+
+def compare(current, baseline, tolerance=0.1):
+    """List the metrics that got worse than the baseline by more than `tolerance` (relative)."""
+    regressions = []
+    for name, metrics in current["results"].items():
+        for metric, value in metrics.items():
+            base = baseline["results"].get(name, {}).get(metric)
+            if base is None or base == 0:
+                continue
+            change = (value - base) / base
+            if (metric in higher_is_better and change < -tolerance) or (metric in lower_is_better and change > tolerance):
+                regressions.append((name, metric, base, value, change))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the Reinforcement environments.")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to save the results")
+    parser.add_argument("--baseline", help="Results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed relative regression")
+    parser.add_argument("--quick", action="store_true", help="Fewer steps and episodes")
+    parser.add_argument("names", nargs="*", help="Only run these benchmarks")
+    args = parser.parse_args()
+
+    current = run_benchmarks(args.names, args.quick)
+    with open(args.output, "w") as f:
+        json.dump(current, f, indent=2)
+    print(f"Results saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.tolerance)
+        for name, metric, base, value, change in regressions:
+            print(f"REGRESSION {name} {metric}: {base:,.1f} -> {value:,.1f} ({change:+.1%})")
+        if regressions:
+            sys.exit(1)
+        print("No regressions")
@@ -0,0 +1,120 @@
+import json
+import os
+
+import numpy as np
+
+
+def atomic_save(path, array):
+    """Write an array as a .npy file, readers see either the old file or the complete new one."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, np.ascontiguousarray(array))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def save_q_table(path, q, dtype=np.float32):
+    """Save a Q-table as a plain .npy file (header + contiguous data) of the given dtype."""
+    atomic_save(path, np.asarray(q, dtype=dtype))
+
+
+def load_q_table(path, mmap_mode="r"):
+    """Load a .npy Q-table, memory-mapped read-only by default so nothing is copied until it is read."""
+    return np.load(path, mmap_mode=mmap_mode)
+
+
+def rng_state(rng):
+    """JSON-serializable state of a NumPy generator."""
+    return rng.bit_generator.state
+
+
+def set_rng_state(rng, state):
+    rng.bit_generator.state = state
+
+
+class QTableSnapshots:
+    """Periodic training snapshots: `<prefix>.<episode>.npy` Q-tables indexed by `<prefix>.json`.
+
+    A snapshot writes the Q-table and the rewards per episode to new .npy files, then atomically
+    replaces the JSON index that points to them, so a crash at any point leaves the previous
+    snapshot loadable. The index also holds the training state needed to resume (episode,
+    epsilon, learning rate, generator states, ...). Snapshots are float64 by default so a resumed
+    run continues exactly like an uninterrupted one, float32 halves their size.
+    """
+
+    def __init__(self, prefix, dtype=np.float64):
+        self.prefix = prefix
+        self.dtype = dtype
+        self.index_path = f"{prefix}.json"
+
+    def exists(self):
+        return os.path.exists(self.index_path)
+
+    def save(self, q, rewards_per_episode, episode, **state):
+        """Snapshot after `episode` episodes, `state` must be JSON-serializable."""
+        previous = self._read_index() if self.exists() else None
+
+        q_path = f"{self.prefix}.{episode}.npy"
+        rewards_path = f"{self.prefix}.{episode}.rewards.npy"
+        save_q_table(q_path, q, self.dtype)
+        atomic_save(rewards_path, rewards_per_episode[:episode])
+
+        index = {
+            "q_table": os.path.basename(q_path),
+            "rewards": os.path.basename(rewards_path),
+            "episode": episode,
+            "state": state,
+        }
+        tmp = f"{self.index_path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(index, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.index_path)
+
+        # The new index is in place, the files of the previous snapshot can go
+        if previous is not None and previous["q_table"] != index["q_table"]:
+            for key in ("q_table", "rewards"):
+                path = self._path(previous[key])
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def load(self, mmap_mode=None):
+        """Latest snapshot as (q, rewards_per_episode, episode, state).
+
+        Pass mmap_mode="r" for a zero-copy read-only Q-table, the default loads a writable copy
+        to resume training from.
+        """
+        index = self._read_index()
+        q = load_q_table(self._path(index["q_table"]), mmap_mode=mmap_mode)
+        rewards = np.load(self._path(index["rewards"]))
+        return q, rewards, index["episode"], index["state"]
+
+    def _read_index(self):
+        with open(self.index_path) as f:
+            return json.load(f)
+
+    def _path(self, name):
+        return os.path.join(os.path.dirname(self.index_path), name)
+
+
+def save_training_snapshot(snapshots, q, rewards_per_episode, episode, epsilon, learning_rate_a, rng, env):
+    """Snapshot a run() training loop after `episode` episodes, with its schedule and every generator it draws from."""
+    snapshots.save(q, rewards_per_episode, episode, epsilon=epsilon, learning_rate_a=learning_rate_a,
+                   rng=rng_state(rng), env_rng=rng_state(env.unwrapped.np_random),
+                   action_rng=rng_state(env.action_space.np_random))
+
+
+def resume_training(snapshots, rewards_per_episode, rng, env):
+    """Continue a run() training loop from its latest snapshot.
+
+    Fills in the rewards of the episodes already trained and restores the generators. Returns
+    (q, episode, epsilon, learning_rate_a) to continue from.
+    """
+    q, rewards, episode, saved = snapshots.load()
+    rewards_per_episode[:episode] = rewards[:len(rewards_per_episode)]
+    set_rng_state(rng, saved["rng"])
+    set_rng_state(env.unwrapped.np_random, saved["env_rng"])
+    set_rng_state(env.action_space.np_random, saved["action_rng"])
+    return q.astype(np.float64), episode, saved["epsilon"], saved["learning_rate_a"]
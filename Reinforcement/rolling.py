@@ -0,0 +1,84 @@
+import numpy as np
+
+
+def rolling_stats(values, window=100, success_threshold=1):
+    """Windowed sum, mean, success rate and variance of every prefix of `values`, in O(n).
+
+    The window of step t is values[max(0, t - window):t + 1], like the scripts' plots, so it
+    holds up to window + 1 values. An episode is a success when its value is >= success_threshold.
+    Returns a dict of arrays with keys "sum", "mean", "success_rate" and "variance".
+    """
+    values = np.asarray(values, dtype=np.float64)
+    t = np.arange(values.size)
+    start = np.maximum(0, t - window)
+    count = t + 1 - start
+
+    def windowed_sum(x):
+        cum = np.concatenate(([0], np.cumsum(x)))
+        return cum[t + 1] - cum[start]
+
+    window_sum = windowed_sum(values)
+
+    # Variance from values shifted by the overall mean, so the sums of squares don't lose precision
+    shifted = values - (values.mean() if values.size else 0)
+    shifted_mean = windowed_sum(shifted) / count
+
+    return {
+        "sum": window_sum,
+        "mean": window_sum / count,
+        "success_rate": windowed_sum(values >= success_threshold) / count,
+        "variance": np.maximum(windowed_sum(shifted ** 2) / count - shifted_mean ** 2, 0),
+    }
+
+
+class RollingStats:
+    """Incremental version of `rolling_stats` for use during training, O(1) per value.
+
+    Keeps the last window + 1 values in a ring buffer with their running sums.
+    """
+
+    def __init__(self, window=100, success_threshold=1):
+        self.window = window
+        self.success_threshold = success_threshold
+        self._values = np.zeros(window + 1)
+        self.count = 0      # Values in the window
+        self.total = 0      # Values added so far
+        self._sum = 0.0
+        self._sum_squares = 0.0
+        self._successes = 0
+
+    def add(self, value):
+        slot = self.total % self._values.size
+        if self.count == self._values.size:
+            old = self._values[slot]
+            self._sum -= old
+            self._sum_squares -= old * old
+            self._successes -= old >= self.success_threshold
+        else:
+            self.count += 1
+
+        self._values[slot] = value
+        self._sum += value
+        self._sum_squares += value * value
+        self._successes += value >= self.success_threshold
+        self.total += 1
+
+    def extend(self, values):
+        for value in values:
+            self.add(value)
+
+    @property
+    def sum(self):
+        return self._sum
+
+    @property
+    def mean(self):
+        return self._sum / self.count if self.count else 0.0
+
+    @property
+    def success_rate(self):
+        return self._successes / self.count if self.count else 0.0
+
+    @property
+    def variance(self):
+        return max(self._sum_squares / self.count - self.mean ** 2, 0.0) if self.count else 0.0
@@ -0,0 +1,10 @@
+"""Import the tabular training scripts by path, they are all called main.py."""
+import importlib.util
+
+
+def load_script(name, path):
+    """Import the script at `path` as a module called `name`."""
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,95 @@
+"""Seeded training runs of the tabular scripts on a local process pool.
+
+Each seed trains `run(episodes, seed=seed)` of taxi_drop/main.py or frozen_lake/main.py in
+its own directory (runs/<script>/seed_<seed>/, with the Q-table pickle and plot of that seed).
+The rolling reward curves of all seeds are aggregated into a mean and a 95% confidence band,
+saved to curves.npz and plotted together in combined.png:
+
+    python seeded_runs.py taxi_drop --episodes 15000 --seeds 8 --num-envs 64
+"""
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from rolling import rolling_stats
+from scripts import load_script
+
+here = os.path.dirname(os.path.abspath(__file__))
+scripts = ("taxi_drop", "frozen_lake")
+
+
+def run_seed(script, seed, episodes, num_envs, out_dir):
+    """Train one seed of a script in its own directory, runs in a worker process."""
+    module = load_script(script, os.path.join(here, script, "main.py"))
+
+    seed_dir = os.path.join(out_dir, f"seed_{seed}")
+    os.makedirs(seed_dir, exist_ok=True)
+    cwd = os.getcwd()
+    os.chdir(seed_dir)
+    try:
+        _, rewards_per_episode = module.run(episodes, num_envs=num_envs, seed=seed)
+    finally:
+        os.chdir(cwd)
+    return rewards_per_episode
+
+
+def aggregate(curves):
+    """Mean and 95% confidence band (normal approximation) over the seeds, curves is (seeds, episodes)."""
+    mean = curves.mean(axis=0)
+    if len(curves) < 2:
+        return mean, mean, mean
+    half_width = 1.96 * curves.std(axis=0, ddof=1) / np.sqrt(len(curves))
+    return mean, mean - half_width, mean + half_width
+
+
+def seeded_runs(script, seeds, episodes=15000, num_envs=1, max_workers=None, out_dir=None):
+    """Train every seed in parallel, save the aggregated curves and the combined plot.
+
+    Results only depend on the seeds, not on the number of workers or the order jobs finish in.
+    Returns the rewards per episode of each seed as an array (seeds, episodes).
+    """
+    if script not in scripts:
+        raise ValueError(f"script must be one of {scripts}, got {script!r}")
+    seeds = list(seeds)
+    out_dir = os.path.abspath(out_dir or os.path.join("runs", script))
+    os.makedirs(out_dir, exist_ok=True)
+
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        rewards = np.stack(list(executor.map(run_seed, [script] * len(seeds), seeds, [episodes] * len(seeds),
+                                             [num_envs] * len(seeds), [out_dir] * len(seeds))))
+
+    curves = np.stack([rolling_stats(r)["sum"] for r in rewards])
+    mean, low, high = aggregate(curves)
+    np.savez(os.path.join(out_dir, "curves.npz"), seeds=np.array(seeds), rewards=rewards,
+             curves=curves, mean=mean, low=low, high=high)
+
+    from matplotlib.figure import Figure
+
+    fig = Figure()
+    ax = fig.subplots()
+    for curve in curves:
+        ax.plot(curve, color="gray", alpha=0.3, linewidth=0.5)
+    ax.plot(mean, label=f"mean of {len(seeds)} seeds")
+    ax.fill_between(np.arange(episodes), low, high, alpha=0.3, label="95% confidence")
+    ax.set_xlabel("episode")
+    ax.set_ylabel("reward of the last 100 episodes")
+    ax.legend()
+    fig.savefig(os.path.join(out_dir, "combined.png"))
+
+    return rewards
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Seeded parallel training runs of a tabular script.")
+    parser.add_argument("script", choices=scripts)
+    parser.add_argument("--episodes", type=int, default=15000)
+    parser.add_argument("--seeds", type=int, default=8, help="Runs seeds 0..N-1")
+    parser.add_argument("--num-envs", type=int, default=1, help="Lockstep simulations per run, see tabular.q_learning")
+    parser.add_argument("--workers", type=int, help="Worker processes, all cores by default")
+    args = parser.parse_args()
+
+    rewards = seeded_runs(args.script, range(args.seeds), args.episodes, args.num_envs, args.workers)
+    final = rewards[:, -100:].mean(axis=1)
+    print(f"Mean reward of the last 100 episodes: {final.mean():.3f} +- {final.std():.3f} over {len(final)} seeds")
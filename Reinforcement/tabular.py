@@ -0,0 +1,270 @@
+import numpy as np
+
+from checkpoint import save_training_snapshot
+from rolling import RollingStats
+
+
+class TransitionTables:
+    """Dense arrays built once from the transition model `env.unwrapped.P` of a toy-text env.
+
+    For every (state, action) there are up to `max_outcomes` outcomes, stored as cumulative
+    probabilities, next states, rewards and terminated flags of shape (states, actions, outcomes).
+    Unused outcome slots repeat the last real outcome with a cumulative probability of 1.
+    """
+
+    def __init__(self, env):
+        unwrapped = env.unwrapped
+        model = unwrapped.P
+        self.n_states = env.observation_space.n
+        self.n_actions = env.action_space.n
+        self.max_episode_steps = env.spec.max_episode_steps if env.spec is not None else None
+        self.initial_state_distrib = np.asarray(unwrapped.initial_state_distrib, dtype=np.float64)
+        self.initial_states = np.flatnonzero(self.initial_state_distrib)
+
+        max_outcomes = max(len(outcomes) for actions in model.values() for outcomes in actions.values())
+        shape = (self.n_states, self.n_actions, max_outcomes)
+        self.probs = np.zeros(shape)
+        self.cum_probs = np.ones(shape)
+        self.next_states = np.zeros(shape, dtype=np.intp)
+        self.rewards = np.zeros(shape)
+        self.terminated = np.zeros(shape, dtype=bool)
+
+        for state, actions in model.items():
+            for action, outcomes in actions.items():
+                for k in range(max_outcomes):
+                    prob, next_state, reward, terminated = outcomes[min(k, len(outcomes) - 1)]
+                    self.next_states[state, action, k] = next_state
+                    self.rewards[state, action, k] = reward
+                    self.terminated[state, action, k] = terminated
+                    if k < len(outcomes):
+                        self.probs[state, action, k] = prob
+                self.cum_probs[state, action, :len(outcomes) - 1] = np.cumsum(self.probs[state, action, :len(outcomes) - 1])
+
+    def reset(self, rng, n):
+        """Sample n initial states."""
+        cum = np.cumsum(self.initial_state_distrib)
+        return np.minimum(np.searchsorted(cum, rng.random(n) * cum[-1], side="right"), self.n_states - 1)
+
+    def step(self, rng, states, actions):
+        """Sample one transition for each (state, action) pair, returns next states, rewards, terminated."""
+        u = rng.random(states.size)
+        outcome = (u[:, None] < self.cum_probs[states, actions]).argmax(axis=1)
+        return (self.next_states[states, actions, outcome],
+                self.rewards[states, actions, outcome],
+                self.terminated[states, actions, outcome])
+
+
+def epsilon_schedule(episodes, epsilon_decay_rate=0.0001):
+    """Epsilon of each episode, starts at 1 and decreases by `epsilon_decay_rate` after every episode."""
+    return np.maximum(1 - np.arange(episodes) * epsilon_decay_rate, 0)
+
+
+def q_learning(env, episodes, num_envs=64, q=None, learning_rate_a=0.9, discount_factor_g=0.9,
+               epsilon_decay_rate=0.0001, final_learning_rate=0.0001, rng=None, first_episode=0):
+    """Tabular Q-learning over `num_envs` simulations of `env` run in lockstep.
+
+    Same hyperparameters and schedule as the run() loops: episode i explores with epsilon
+    max(1 - i * epsilon_decay_rate, 0), and once epsilon reaches 0 the learning rate drops to
+    `final_learning_rate`. Episodes are handed out to the simulations in order, actions are chosen
+    and the Q-table is updated for all of them at once from the transition model, without stepping
+    the gym env. When several simulations update the same (state, action) in one step, the
+    Q-table moves by their mean update.
+
+    `first_episode` continues the schedule of an earlier call, to train in chunks.
+    Returns the Q-table and the total reward of each episode.
+    """
+    tables = TransitionTables(env)
+    rng = np.random.default_rng() if rng is None else rng
+    if q is None:
+        q = np.zeros((tables.n_states, tables.n_actions))
+    num_envs = min(num_envs, episodes)
+    max_steps = tables.max_episode_steps or np.iinfo(np.intp).max
+
+    epsilons = epsilon_schedule(first_episode + episodes, epsilon_decay_rate)[first_episode:]
+    learning_rates = np.where(epsilons == 0, final_learning_rate, learning_rate_a)
+    rewards_per_episode = np.zeros(episodes)
+
+    # Simulation i plays episode episode_of[i]
+    episode_of = np.arange(num_envs)
+    next_episode = num_envs
+    states = tables.reset(rng, num_envs)
+    steps = np.zeros(num_envs, dtype=np.intp)
+    episode_rewards = np.zeros(num_envs)
+    active = np.arange(num_envs)
+    flat_q = q.reshape(-1)
+
+    while active.size:
+        s = states[active]
+        episode = episode_of[active]
+
+        # Batched epsilon-greedy action selection
+        explore = rng.random(active.size) < epsilons[episode]
+        actions = np.where(explore, rng.integers(tables.n_actions, size=active.size), q[s].argmax(axis=1))
+
+        new_states, rewards, terminated = tables.step(rng, s, actions)
+
+        # Batched Q-learning update, duplicated (state, action) pairs share their mean update
+        update = learning_rates[episode] * (rewards + discount_factor_g * q[new_states].max(axis=1) - q[s, actions])
+        index, inverse, counts = np.unique(s * tables.n_actions + actions, return_inverse=True, return_counts=True)
+        flat_q[index] += np.bincount(inverse, weights=update) / counts
+
+        states[active] = new_states
+        steps[active] += 1
+        episode_rewards[active] += rewards
+
+        # Finished simulations record their episode and start the next one
+        done = active[terminated | (steps[active] >= max_steps)]
+        if done.size:
+            rewards_per_episode[episode_of[done]] = episode_rewards[done]
+            new_episodes = np.arange(next_episode, next_episode + done.size)
+            next_episode += done.size
+            episode_of[done] = new_episodes
+            states[done] = tables.reset(rng, done.size)
+            steps[done] = 0
+            episode_rewards[done] = 0
+            active = active[episode_of[active] < episodes]
+
+    return q, rewards_per_episode
+
+
+
+def train_lockstep(env, q, rewards_per_episode, start=0, num_envs=64, learning_rate_a=0.9, discount_factor_g=0.9,
+                   epsilon_decay_rate=0.0001, final_learning_rate=0.0001, rng=None, checkpoint_every=0,
+                   snapshots=None, metrics=None, stats=None):
+    """The lockstep training of the run() scripts: `q_learning` from episode `start` to the end of rewards_per_episode.
+
+    Trains in chunks of `checkpoint_every` episodes with a snapshot after each (all at once
+    without), and logs the reward of every episode to `metrics` if given, with the rolling mean and
+    success rate of `stats` (a `rolling.RollingStats`). Returns the Q-table.
+    """
+    episodes = len(rewards_per_episode)
+    chunk = checkpoint_every or episodes
+    if metrics is not None and stats is None:
+        stats = RollingStats()
+        stats.extend(rewards_per_episode[max(start - stats.window - 1, 0):start])
+    for first in range(start, episodes, chunk):
+        n = min(chunk, episodes - first)
+        q, rewards_per_episode[first:first + n] = q_learning(
+            env, n, num_envs=num_envs, q=q, learning_rate_a=learning_rate_a, discount_factor_g=discount_factor_g,
+            epsilon_decay_rate=epsilon_decay_rate, final_learning_rate=final_learning_rate, rng=rng, first_episode=first)
+
+        # Where the schedule of the sequential loop is after these episodes
+        epsilon = max(1 - (first + n) * epsilon_decay_rate, 0)
+        if epsilon == 0:
+            learning_rate_a = final_learning_rate
+        if metrics is not None:
+            for episode in range(first, first + n):
+                stats.add(rewards_per_episode[episode])
+                metrics.log(episode=episode, reward=rewards_per_episode[episode], rolling_mean=stats.mean,
+                            success_rate=stats.success_rate)
+        if checkpoint_every:
+            save_training_snapshot(snapshots, q, rewards_per_episode, first + n, epsilon, learning_rate_a, rng, env)
+    return q
+
+
+def greedy_policy(q):
+    """Greedy action of every state, the first best action on ties like np.argmax in run()."""
+    return np.asarray(q).argmax(axis=1)
+
+
+def evaluate_policy(env, policy, episodes=1000, rng=None):
+    """Run a fixed policy (action per state) for `episodes` episodes at once, without rendering.
+
+    An episode is a success when it terminates with a positive reward (Taxi drop-off, FrozenLake goal).
+    Returns the success rate, the mean total reward and statistics of the episode lengths.
+    """
+    tables = env if isinstance(env, TransitionTables) else TransitionTables(env)
+    rng = np.random.default_rng(rng)
+    policy = np.asarray(policy)
+    max_steps = tables.max_episode_steps or np.iinfo(np.intp).max
+
+    states = tables.reset(rng, episodes)
+    total_rewards = np.zeros(episodes)
+    steps = np.zeros(episodes, dtype=np.intp)
+    success = np.zeros(episodes, dtype=bool)
+    active = np.arange(episodes)
+
+    while active.size:
+        new_states, rewards, terminated = tables.step(rng, states[active], policy[states[active]])
+        states[active] = new_states
+        total_rewards[active] += rewards
+        steps[active] += 1
+        success[active] = terminated & (rewards > 0)
+        active = active[~terminated & (steps[active] < max_steps)]
+
+    return {
+        "episodes": episodes,
+        "success_rate": success.mean(),
+        "mean_reward": total_rewards.mean(),
+        "mean_steps": steps.mean(),
+        "p50_steps": np.percentile(steps, 50),
+        "p90_steps": np.percentile(steps, 90),
+        "max_steps": steps.max(),
+    }
+
+def expected_backup(tables, v, discount_factor_g=0.9):
+    """Q-table of the one-step lookahead r + gamma * V(s') under the transition model.
+
+    The value of terminal outcomes is 0, like the never-updated rows of a sampled Q-table.
+    """
+    future = np.where(tables.terminated, 0, v[tables.next_states])
+    return (tables.probs * (tables.rewards + discount_factor_g * future)).sum(axis=2)
+
+
+def value_iteration(env, discount_factor_g=0.9, tol=1e-8, max_iterations=100_000):
+    """Solve the env's transition model with vectorized value iteration.
+
+    Stops when no state value changes by more than `tol`. Returns the Q-table and the number of
+    iterations.
+    """
+    tables = env if isinstance(env, TransitionTables) else TransitionTables(env)
+    v = np.zeros(tables.n_states)
+    for iteration in range(1, max_iterations + 1):
+        q = expected_backup(tables, v, discount_factor_g)
+        new_v = q.max(axis=1)
+        delta = np.abs(new_v - v).max()
+        v = new_v
+        if delta <= tol:
+            break
+    return expected_backup(tables, v, discount_factor_g), iteration
+
+
+def policy_iteration(env, discount_factor_g=0.9, tol=1e-8, max_iterations=1000):
+    """Solve the env's transition model with policy iteration.
+
+    Each policy is evaluated exactly by solving the linear system V = R + gamma * P V, then
+    improved greedily until it doesn't change (ties within `tol` keep the current action).
+    Returns the Q-table and the number of iterations.
+    """
+    tables = env if isinstance(env, TransitionTables) else TransitionTables(env)
+    states = np.arange(tables.n_states)
+    policy = np.zeros(tables.n_states, dtype=np.intp)
+    expected_rewards = (tables.probs * tables.rewards).sum(axis=2)
+    transitions = np.where(tables.terminated, 0, tables.probs)   # Terminal outcomes have no future
+
+    for iteration in range(1, max_iterations + 1):
+        # Dense (states x states) transition matrix of the current policy
+        p_policy = np.zeros((tables.n_states, tables.n_states))
+        np.add.at(p_policy, (states[:, None], tables.next_states[states, policy]), transitions[states, policy])
+        v = np.linalg.solve(np.eye(tables.n_states) - discount_factor_g * p_policy, expected_rewards[states, policy])
+
+        q = expected_backup(tables, v, discount_factor_g)
+        best = q.argmax(axis=1)
+        improved = q[states, best] > q[states, policy] + tol
+        if not improved.any():
+            break
+        policy = np.where(improved, best, policy)
+    return q, iteration
+
+
+solvers = {
+    "value_iteration": value_iteration,
+    "policy_iteration": policy_iteration,
+}
+
+
+def solve(env, method="value_iteration", discount_factor_g=0.9, tol=1e-8):
+    """Optimal Q-table of the env with one of the `solvers`, returns it with the number of iterations."""
+    if method not in solvers:
+        raise ValueError(f"method must be one of {tuple(solvers)}, got {method!r}")
+    return solvers[method](env, discount_factor_g=discount_factor_g, tol=tol)
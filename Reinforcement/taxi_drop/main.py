@@ -1,72 +1,139 @@
 import gymnasium as gym
 import numpy as np
-import matplotlib.pyplot as plt
 import pickle
+import os
+import sys
 
-def run(episodes, is_training=True, render=False):
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))                    # Reinforcement/ shared modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))   # metrics.py at the repo root
+from tabular import train_lockstep, solve, greedy_policy, evaluate_policy
+from rolling import rolling_stats, RollingStats
+from metrics import MetricsWriter, save_plot
+from checkpoint import QTableSnapshots, save_q_table, load_q_table, save_training_snapshot, resume_training
+
+def run(episodes, is_training=True, render=False, num_envs=1, warm_start=False, seed=None, checkpoint_every=0, resume=False, metrics_path=None):
 
     env = gym.make('Taxi-v3', render_mode='human' if render else None)
 
-    if(is_training):
+    if(is_training and not warm_start):
         q = np.zeros((env.observation_space.n, env.action_space.n)) # init a 500 x 6 array
-    else:
+    elif(is_training or not os.path.exists('taxi.npy')):
         f = open('taxi.pkl', 'rb')
         q = pickle.load(f)
         f.close()
+    else:
+        q = load_q_table('taxi.npy')   # Memory-mapped, read-only
 
     learning_rate_a = 0.9 # alpha or learning rate
     discount_factor_g = 0.9 # gamma or discount rate. Near 0: more weight/reward placed on immediate state. Near 1: more on future state.
     epsilon = 1         # 1 = 100% random actions
     epsilon_decay_rate = 0.0001        # epsilon decay rate. 1/0.0001 = 10,000
-    rng = np.random.default_rng()   # random number generator
+    rng = np.random.default_rng(seed)   # random number generator
+    env.reset(seed=seed)            # Seeds the env's own generator, later resets continue from it
+    env.action_space.seed(seed)
 
     rewards_per_episode = np.zeros(episodes)
+    start = 0
+    metrics = MetricsWriter(metrics_path) if metrics_path else None   # Per-episode rewards, .csv or .jsonl
+    snapshots = QTableSnapshots('taxi_snapshot')
+
+    if is_training and resume and snapshots.exists():
+        q, start, epsilon, learning_rate_a = resume_training(snapshots, rewards_per_episode, rng, env)
+
+    # Rolling reward and success rate for the metrics, continued from the episodes already trained
+    stats = RollingStats(window=100)
+    stats.extend(rewards_per_episode[max(start - stats.window - 1, 0):start])
+
+    if is_training and num_envs > 1:
+        # Train num_envs simulations in lockstep from the env's transition model, in chunks between snapshots
+        q = train_lockstep(env, q, rewards_per_episode, start, num_envs=num_envs, learning_rate_a=learning_rate_a,
+                           discount_factor_g=discount_factor_g, epsilon_decay_rate=epsilon_decay_rate, rng=rng,
+                           checkpoint_every=checkpoint_every, snapshots=snapshots, metrics=metrics, stats=stats)
+    else:
+        for i in range(start, episodes):
+            state = env.reset()[0]  # states: 0 to 63, 0=top left corner,63=bottom right corner
+            terminated = False      # True when fall in hole or reached goal
+            truncated = False       # True when actions > 200
 
-    for i in range(episodes):
-        state = env.reset()[0]  # states: 0 to 63, 0=top left corner,63=bottom right corner
-        terminated = False      # True when fall in hole or reached goal
-        truncated = False       # True when actions > 200
+            rewards = 0
+            while(not terminated and not truncated):
+                if is_training and rng.random() < epsilon:
+                    action = env.action_space.sample() # actions: 0=left,1=down,2=right,3=up
+                else:
+                    action = np.argmax(q[state,:])
 
-        rewards = 0
-        while(not terminated and not truncated):
-            if is_training and rng.random() < epsilon:
-                action = env.action_space.sample() # actions: 0=left,1=down,2=right,3=up
-            else:
-                action = np.argmax(q[state,:])
+                new_state,reward,terminated,truncated,_ = env.step(action)
 
-            new_state,reward,terminated,truncated,_ = env.step(action)
+                rewards += reward
 
-            rewards += reward
+                if is_training:
+                    q[state,action] = q[state,action] + learning_rate_a * (
+                        reward + discount_factor_g * np.max(q[new_state,:]) - q[state,action]
+                    )
 
-            if is_training:
-                q[state,action] = q[state,action] + learning_rate_a * (
-                    reward + discount_factor_g * np.max(q[new_state,:]) - q[state,action]
-                )
+                state = new_state
 
-            state = new_state
+            epsilon = max(epsilon - epsilon_decay_rate, 0)
 
-        epsilon = max(epsilon - epsilon_decay_rate, 0)
+            if(epsilon==0):
+                learning_rate_a = 0.0001
 
-        if(epsilon==0):
-            learning_rate_a = 0.0001
 
+            rewards_per_episode[i] = rewards
 
-        rewards_per_episode[i] = rewards
+            if metrics is not None:
+                stats.add(rewards_per_episode[i])
+                metrics.log(episode=i, reward=rewards_per_episode[i], rolling_mean=stats.mean, success_rate=stats.success_rate)
+            if is_training and checkpoint_every and (i + 1) % checkpoint_every == 0:
+                save_training_snapshot(snapshots, q, rewards_per_episode, i + 1, epsilon, learning_rate_a, rng, env)
 
     env.close()
+    if metrics is not None:
+        metrics.close()
 
-    sum_rewards = np.zeros(episodes)
-    for t in range(episodes):
-        sum_rewards[t] = np.sum(rewards_per_episode[max(0, t-100):(t+1)])
-    plt.plot(sum_rewards)
-    plt.savefig('taxi.png')
+    sum_rewards = rolling_stats(rewards_per_episode, window=100)["sum"]
+    save_plot('taxi.png', sum_rewards)   # Drawn on a background thread
 
     if is_training:
         f = open("taxi.pkl","wb")
         pickle.dump(q, f)
         f.close()
+        save_q_table("taxi.npy", q)
+
+    return q, rewards_per_episode
+
+def plan(method="value_iteration", tol=1e-8):
+    # Solve the env's transition model directly, writes the same Q-table as run()
+    env = gym.make('Taxi-v3')
+
+    q, iterations = solve(env, method, discount_factor_g=0.9, tol=tol)
+    env.close()
+    print(f"{method} converged in {iterations} iterations")
+
+    f = open("taxi.pkl","wb")
+    pickle.dump(q, f)
+    f.close()
+    save_q_table("taxi.npy", q)
+
+def evaluate(episodes=1000, seed=None):
+    # Greedy policy of the saved Q-table over many episodes at once, no rendering, plots or files written
+    if os.path.exists("taxi.npy"):
+        q = load_q_table("taxi.npy")
+    else:
+        f = open("taxi.pkl", "rb")
+        q = pickle.load(f)
+        f.close()
+
+    env = gym.make('Taxi-v3')
+    stats = evaluate_policy(env, greedy_policy(q), episodes=episodes, rng=seed)
+    env.close()
+    return stats
 
 if __name__ == '__main__':
     # run(15000)
+    # run(15000, num_envs=64)   # Lockstep training, much faster
+    # run(15000, checkpoint_every=1000, resume=True)   # Snapshots every 1000 episodes, continues from the last one
+    # print(evaluate(10000))     # Success rate and episode lengths of the saved Q-table
+    # plan()                     # Optimal Q-table from the transition model, run(..., warm_start=True) trains from it
 
     run(10, is_training=False, render=True)
\ No newline at end of file
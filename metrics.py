@@ -0,0 +1,167 @@
+"""Metrics export and plotting that stay off the training loop's critical path.
+
+`MetricsWriter` buffers scalar rows in memory and hands them to a background thread that appends
+them to a CSV or JSONL file. Values can be tensors: they are kept as they are (detached) and only
+converted to numbers on the writer thread, with one `.tolist()` per flush, so logging a loss never
+syncs the device. `save_plot` imports matplotlib only when a plot is requested and draws it on a
+background thread.
+"""
+import atexit
+import csv
+import json
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class MetricsWriter:
+    """Append rows of scalars to a .csv or .jsonl file from a background thread.
+
+    Rows are buffered and handed to the thread every `flush_every` rows, on `flush()` and on
+    `close()`, which also runs at interpreter exit. A CSV file starts with the columns of `fields`
+    (or of its existing header) and is rewritten with a wider header when a row has a new key, so
+    no value is dropped. Columns a row doesn't have are left empty.
+    """
+    formats = ("csv", "jsonl")
+
+    def __init__(self, path, flush_every=100, format=None, fields=None):
+        self.path = os.path.abspath(path)
+        self.format = format or os.path.splitext(path)[1].lstrip(".")
+        if self.format not in self.formats:
+            raise ValueError(f"format must be one of {self.formats}, got {self.format!r}")
+
+        self.flush_every = flush_every
+        self._rows = []
+        self._queue = queue.Queue()
+        self._fields = list(fields) if fields else None
+        self._closed = False
+        self._thread = threading.Thread(target=self._write_loop, name="metrics-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def log(self, **values):
+        """Buffer one row, tensors are detached but not copied to the host."""
+        self._rows.append({key: value.detach() if hasattr(value, "detach") else value for key, value in values.items()})
+        if len(self._rows) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """Hand the buffered rows to the writer thread, doesn't wait for them to be written."""
+        if self._rows:
+            self._queue.put(self._rows)
+            self._rows = []
+
+    def close(self):
+        """Flush and wait until every row is on disk."""
+        if self._closed:
+            return
+        self.flush()
+        self._queue.put(None)
+        self._thread.join()
+        self._closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _write_loop(self):
+        while True:
+            rows = self._queue.get()
+            if rows is None:
+                return
+            rows = self._to_python(rows)
+
+            if self.format == "jsonl":
+                with open(self.path, "a") as f:
+                    f.writelines(json.dumps(row) + "\n" for row in rows)
+            else:
+                self._write_csv(rows)
+
+    def _write_csv(self, rows):
+        """Append rows, rewriting the file with a wider header first if they have new columns."""
+        existing = []
+        header = None
+        if os.path.exists(self.path) and os.path.getsize(self.path):
+            with open(self.path, newline="") as f:
+                header = next(csv.reader(f))
+                if self._fields is None:
+                    self._fields = list(header)
+                if any(key not in self._fields for row in rows for key in row):
+                    existing = list(csv.DictReader(f, fieldnames=header))
+        if self._fields is None:
+            self._fields = []
+
+        for row in rows:
+            self._fields.extend(key for key in row if key not in self._fields)
+
+        if header != self._fields:
+            # New file, or new columns: write the header and the rows already in the file to a new file
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=self._fields)
+                writer.writeheader()
+                writer.writerows(existing)
+            os.replace(tmp, self.path)
+
+        with open(self.path, "a", newline="") as f:
+            csv.DictWriter(f, fieldnames=self._fields).writerows(rows)
+
+    @staticmethod
+    def _to_python(rows):
+        """Convert the tensor values of a batch of rows with one stack and one `.tolist()` per device."""
+        tensors = {}
+        for i, row in enumerate(rows):
+            for key, value in row.items():
+                if hasattr(value, "detach"):
+                    tensors.setdefault((value.device, value.dtype), []).append((i, key, value))
+                elif hasattr(value, "tolist"):   # NumPy scalars
+                    row[key] = value.tolist()
+
+        if tensors:
+            import torch
+        for items in tensors.values():
+            values = torch.stack([value.reshape(()) for _, _, value in items]).tolist()
+            for (i, key, _), value in zip(items, values):
+                rows[i][key] = value
+        return rows
+
+
+_plot_executor = None
+
+
+def save_plot(path, *series, xlabel=None, ylabel=None, background=True):
+    """Plot one or more series to an image file, matplotlib is imported on first use.
+
+    Uses a standalone `Figure` instead of pyplot so plots don't share global state, and by default
+    draws on a background thread (returns its future, the interpreter waits for it at exit).
+    """
+    global _plot_executor
+    path = os.path.abspath(path)   # The caller may change directory before the plot is drawn
+
+    def draw():
+        from matplotlib.figure import Figure
+
+        fig = Figure()
+        ax = fig.subplots()
+        for values in series:
+            ax.plot(values)
+        if xlabel:
+            ax.set_xlabel(xlabel)
+        if ylabel:
+            ax.set_ylabel(ylabel)
+        fig.savefig(path)
+
+    if not background:
+        return draw()
+    if _plot_executor is None:
+        _plot_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="plot")
+    return _plot_executor.submit(draw)
+
+
+def wait_for_plots():
+    """Block until every plot requested so far is written."""
+    if _plot_executor is not None:
+        _plot_executor.submit(lambda: None).result()   # One worker, so this runs after all earlier plots